@@ -1,6 +1,6 @@
 import os
-from typing import List, Dict
-from fastapi import FastAPI, Query
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
 from chromadb.config import Settings
 import streamlit as st
@@ -13,9 +13,12 @@ from ai_helpers import (
     chunk_text,
     store_chunks,
     query_chunks,
-    flatten_documents,
+    query_chunks_batch,
+    retrieve_context,
     get_openai_response,
     save_uploaded_files,
+    warm_up_models,
+    model_registry_stats,
 )
 
 # Ensure tokenizers parallelism is disabled before any import that may use tokenizers
@@ -40,6 +43,13 @@ _HIDE_STREAMLIT_STYLE = """
 # ----------- Step 4: FastAPI for Semantic Search -----------
 app = FastAPI()
 
+
+@app.on_event("startup")
+def load_embedding_model():
+    # Load the embedding model once so the first /search doesn't pay for it
+    warm_up_models()
+
+
 class SearchRequest(BaseModel):
     query: str
 
@@ -49,6 +59,33 @@ def search(request: SearchRequest):
     results = query_chunks(request.query, n_results=5)
     return {"results": results.get('documents', []), "metadatas": results.get('metadatas', [])}
 
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    n_results: int = 5
+    where: Optional[Dict[str, Any]] = None
+    include: List[str] = ["documents", "metadatas", "distances"]
+
+
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest):
+    # One encode pass and one vector-store query for the whole batch
+    try:
+        results = query_chunks_batch(request.queries, n_results=request.n_results,
+                                     where=request.where, include=request.include)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fields = ["ids", *request.include]
+    return {"results": [
+        {"query": query, **{field: results[field][i] for field in fields if results.get(field) is not None}}
+        for i, query in enumerate(request.queries)
+    ]}
+
+
+@app.get("/stats/models")
+def model_stats():
+    return model_registry_stats()
+
 # ----------- Step 5: Streamlit UI with LLM -----------
 def streamlit_ui():
     # hide Streamlit menu items and set UI
@@ -57,6 +94,9 @@ def streamlit_ui():
     except Exception:
         pass
     st.title("AI Agent PDF Semantic Search")
+    # Shared across Streamlit reruns; only the first run actually loads the model
+    with st.spinner("Loading embedding model..."):
+        warm_up_models()
     # Track whether documents have been uploaded/processed in this session
     if 'has_docs' not in st.session_state:
         st.session_state['has_docs'] = False
@@ -92,20 +132,17 @@ def streamlit_ui():
         # Show a progress bar and spinner to indicate work is happening
         progress = st.progress(0)
         with st.spinner("Retrieving relevant chunks..."):
-            results = query_chunks(query, n_results=3)
+            # Best chunks first, deduplicated, tagged by source and packed under the token budget
+            context = retrieve_context(query, n_results=8)
         progress.progress(40)
-        raw_docs = results.get('documents', [])
-        flat_docs = flatten_documents(raw_docs)
-
-        context = " ".join(flat_docs)
 
         # Debug: show top retrieved chunks so you can verify the context
         try:
-            st.write(f"Context length (chars): {len(context)}")
+            st.write(f"Context: {len(context.sources)} chunks, {context.tokens} tokens")
         except Exception:
             pass
 
-        if not context.strip():
+        if not context.sources:
             st.warning("No relevant context found for your query.")
         else:
             # Use OpenAI LLM (set OPENAI_API_KEY env variable)
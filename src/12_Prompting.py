@@ -1,10 +1,10 @@
 import os
-from openai import OpenAI
+from llm_client import get_llm_client
 
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
 	raise RuntimeError("OPENAI_API_KEY environment variable is not set")
-client = OpenAI(api_key=api_key)
+client = get_llm_client(api_key)
 
 prompt = """
 You are a helpful assistant.
@@ -14,7 +14,7 @@ Fields: name, city, topic
 Text: "Hi, I'm Asha from Mumbai, and I need help
 understanding insurance claims."
 """
-resp = client.chat.completions.create(
+resp = client.create(
 	model="gpt-4.1-mini",
 	messages=[{"role": "user", "content": prompt}],
 )
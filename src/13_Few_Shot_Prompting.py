@@ -1,10 +1,10 @@
 import os
-from openai import OpenAI
+from llm_client import get_llm_client
 
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
 	raise RuntimeError("OPENAI_API_KEY environment variable is not set")
-client = OpenAI(api_key=api_key)
+client = get_llm_client(api_key)
 
 prompt = """
 You are an AI that classifies customer feedback as Positive, Neutral, or Negative.
@@ -18,7 +18,7 @@ Now classify the sentiment of the following text:
 Text: "The movie was okay, nothing special" →
 
 """
-resp = client.chat.completions.create(
+resp = client.create(
 	model="gpt-4.1-mini",
 	messages=[{"role": "user", "content": prompt}],
 )
@@ -1,11 +1,11 @@
 import os
 import json
-from openai import OpenAI
+from llm_client import get_llm_client
 
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
 	raise RuntimeError("OPENAI_API_KEY environment variable is not set")
-client = OpenAI(api_key=api_key)
+client = get_llm_client(api_key)
 
 user_input = "Hi, I'm Sachin from Mumbai, and I need help practicing bowling."
 
@@ -13,7 +13,7 @@ with open("./prompts/prompts_template.json") as f:
     prompts = json.load(f)
 prompt = prompts["extract_user"]["template"].format(text=user_input)
 
-resp = client.chat.completions.create(
+resp = client.create(
 model="gpt-4.1-mini",
 messages=[{"role": "user", "content": prompt}]
 )
@@ -1,10 +1,10 @@
 import os
-from openai import OpenAI
+from llm_client import get_llm_client
 
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
 	raise RuntimeError("OPENAI_API_KEY environment variable is not set")
-client = OpenAI(api_key=api_key)
+client = get_llm_client(api_key)
 
 goal = input("Enter the goal for the agent: ")
 
@@ -21,7 +21,7 @@ If you unable to find the tool, respond "Tool Not Found".
 """
 prompt += f"Goal: {goal}\n"
 
-resp = client.chat.completions.create(
+resp = client.create(
 model="gpt-4.1-mini",
 messages=[{"role": "user", "content": prompt}]
 )
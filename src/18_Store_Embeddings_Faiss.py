@@ -1,9 +1,6 @@
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-
-# Initialize model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from ai_helpers import encode_chunks, encode_queries
 
 # Documents and IDs
 documents = [
@@ -12,8 +9,8 @@ documents = [
     "Dhoni has good friends network"
 ]
 
-# Embed documents
-embeddings = model.encode(documents)
+# Embed documents (cached on disk, so re-runs skip the model)
+embeddings = encode_chunks(documents)
 embeddings = np.array(embeddings).astype('float32')
 
 # Build FAISS index
@@ -22,7 +19,7 @@ index.add(embeddings)
 
 # Query
 query = "How do networks learn?"
-query_embedding = model.encode([query]).astype('float32')
+query_embedding = encode_queries([query]).astype('float32')
 D, I = index.search(query_embedding, k=1)
 
 # Print most similar document
@@ -1,112 +1,77 @@
+import asyncio
 import os
-import re
-from typing import Optional, Tuple
-from openai import OpenAI
+from typing import Dict, List, Optional
+import numpy as np
+from llm_client import LLMClient, get_llm_client
+from agent_runtime import run_agent
+from tool_cache import ToolCache, ToolPolicy
+from tool_registry import ToolRegistry
+from safe_math import evaluate
 
 
-def get_openai_client() -> OpenAI:
+def get_openai_client() -> LLMClient:
+    # Shared with the rest of the process: rate limited, retries 429s and timeouts
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY environment variable is not set")
-    return OpenAI(api_key=api_key)
+    return get_llm_client(api_key)
 
 
-def parse_action(response: str) -> Tuple[Optional[str], Optional[str]]:
-    """Parse the model response to extract tool action or finish signal."""
-    # First check for Finish:
-    m = re.search(r'Finish:\s*(.*)', response, flags=re.IGNORECASE)
-    if m:
-        return "Finish", m.group(1).strip()
-
-    # Then check for Action: Tool[arg]
-    match = re.search(r'Action:\s*(\w+)\s*\[(.*?)\]', response, flags=re.IGNORECASE)
-    if match:
-        return match.group(1), match.group(2).strip()
-    return None, None
+TOOLS = ToolRegistry()
 
 
+@TOOLS.register("Search", "web search", {"query": {"type": "string", "description": "what to search for"}})
 def search_web(query: str) -> str:
     # In production you'd call a real search API or use a SERP client.
     return f"top results for: {query}"
 
 
-def calculate(expression: str) -> str:
-    """Safe calculator: evaluate simple numeric expressions only."""
+@TOOLS.register("Calculate", "simple math", {
+    "expression": {"type": "string", "description": "arithmetic expression, e.g. (120 - 80) / 80 * 100"},
+    "values": {"type": "object", "description": "optional named lists of numbers the expression is "
+                                                "evaluated over element-wise, e.g. {\"prev\": [80, 95], \"cur\": [95, 120]}"},
+}, required=["expression"])
+def calculate(expression: str, values: Optional[Dict[str, List[float]]] = None) -> str:
+    """Safe calculator: arithmetic only, with size and time limits (see safe_math)."""
     try:
-        # Restrict the available builtins for safety
-        allowed_names = {"__builtins__": {}}
-        # Evaluate the expression in a restricted namespace
-        result = eval(expression, allowed_names, {})
-        return str(result)
+        result = evaluate(expression, values)
+        return str(result.tolist() if isinstance(result, np.ndarray) else result)
     except Exception as e:
         return f"Calculation error: {e}"
 
 
-TOOLS = {
-    "Search": search_web,
-    "Calculate": calculate,
-}
+# Shared by every run in this process; search results go stale, arithmetic does not
+TOOL_CACHE = ToolCache({
+    "Search": ToolPolicy(ttl_seconds=600),
+    "Calculate": ToolPolicy(ttl_seconds=float("inf"), normalize=lambda expr: "".join(expr.split())),
+})
 
 
-def run(goal: str, max_steps: int = 5, model: str = "gpt-4.1-mini") -> None:
+async def run_async(goal: str, max_steps: int = 5, model: str = "gpt-4.1-mini", tool_timeout: float = 10.0) -> Optional[str]:
+    """Print agent events as they stream in; return the final answer, if any."""
     client = get_openai_client()
-
-    system_prompt = (
-        "You are an agent that can call tools.\n"
-        "When you need to call a tool, respond exactly with: Action: <ToolName>[<argument>]\n"
-        "When you are finished and want to return a final answer, respond with: Finish: <answer>\n"
-        "Available tools: Search (web search), Calculate (simple math).\n"
-        "Only use the tools when necessary. Keep reasoning concise."
-    )
-
-    state = f"Goal: {goal}\n"
-
-    for step in range(max_steps):
-        user_message = f"Current state:\n{state}\nDecide next action (Action[...] or Finish: ...):"
-        try:
-            resp = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message},
-                ],
-            )
-        except Exception as e:
-            print("OpenAI API error:", e)
-            break
-
-        try:
-            response_text = resp.choices[0].message.content.strip()
-        except Exception:
-            response_text = str(resp)
-
-        print(f"\n[Step {step+1}] LLM response:\n{response_text}\n")
-
-        tool_name, arg = parse_action(response_text)
-        if tool_name is None:
-            print("No actionable instruction found — stopping.")
-            break
-
-        if tool_name == "Finish":
-            print("Final answer:", arg)
-            return
-
-        # Execute tool if available
-        tool = TOOLS.get(tool_name)
-        if not tool:
-            observation = f"Unknown tool requested: {tool_name}"
+    async for event in run_agent(goal, TOOLS, client, model=model, max_steps=max_steps,
+                                 tool_timeout=tool_timeout, cache=TOOL_CACHE):
+        if event.kind == "llm":
+            print(f"\n[Step {event.step}] LLM response ({event.data['seconds']:.2f}s, "
+                  f"prompt {event.data['prompt_tokens']} tokens):\n{event.data['response']}\n")
+        elif event.kind == "repair":
+            print(f"Could not use the reply ({event.data['problem']}); asking the model to fix its format.")
+        elif event.kind == "action":
+            print(f"Executing tool {event.data['tool']} with arg: {event.data['arg']}")
+        elif event.kind == "observation":
+            print(f"TOOL RESULT ({event.data['tool']}, {event.data['status']}, {event.data['seconds']:.2f}s):",
+                  event.data["observation"])
+        elif event.kind == "finish":
+            print("Final answer:", event.data["answer"])
+            return event.data["answer"]
         else:
-            print(f"Executing tool {tool_name} with arg: {arg}")
-            try:
-                observation = tool(arg)
-            except Exception as e:
-                observation = f"Tool execution error: {e}"
+            print(event.data["reason"] + " — stopping.")
+    return None
 
-        print("TOOL RESULT:", observation)
-        # Append observation and continue
-        state += f"Action: {tool_name}[{arg}]\nObservation: {observation}\n"
 
-    print("Reached max steps without a Finish action.")
+def run(goal: str, max_steps: int = 5, model: str = "gpt-4.1-mini") -> None:
+    asyncio.run(run_async(goal, max_steps=max_steps, model=model))
 
 
 if __name__ == "__main__":
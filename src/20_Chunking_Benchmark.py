@@ -0,0 +1,71 @@
+import random
+import time
+from chunking import chunk_texts, iter_chunks
+
+
+# The original implementations, kept here as the baseline to compare against
+def legacy_chunk_text(text, chunk_size=500):
+    sentences = text.split('. ')
+    chunks, chunk = [], ""
+    for sentence in sentences:
+        if len(chunk) + len(sentence) < chunk_size:
+            chunk += sentence + ". "
+        else:
+            chunks.append(chunk.strip())
+            chunk = sentence + ". "
+    if chunk:
+        chunks.append(chunk.strip())
+    return chunks
+
+
+def legacy_chunk_by_paragraphs(text):
+    lines = text.split('\n')
+    chunks = []
+    current_chunk = ""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        current_chunk += line + " "
+        if len(current_chunk) >= 300:
+            if line.endswith(('.', '!', '?')):
+                chunks.append(current_chunk.strip())
+                current_chunk = ""
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def make_text(n_chars, seed=0):
+    """Synthetic document: sentences of random words, wrapped into lines and paragraphs."""
+    rng = random.Random(seed)
+    words = ["agent", "model", "vector", "retrieval", "token", "embedding", "chunk", "index", "query", "context"]
+    parts, size = [], 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 25))).capitalize() + "."
+        parts.append(sentence)
+        parts.append(rng.choice([" ", " ", "\n", "\n\n"]))
+        size += len(sentence) + 1
+    return "".join(parts)
+
+
+def bench(name, fn, text, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = fn(text)
+        best = min(best, time.perf_counter() - start)
+    mb_per_s = len(text) / best / 1e6
+    print(f"{name:<34} {best * 1000:9.1f} ms  {mb_per_s:7.1f} MB/s  {len(chunks):7d} chunks")
+
+
+for n_chars in (1_000_000, 10_000_000):
+    text = make_text(n_chars)
+    print(f"\nText size: {len(text) / 1e6:.1f} MB")
+    bench("legacy chunk_text", legacy_chunk_text, text)
+    bench("engine sentence (500 chars)", lambda t: list(iter_chunks([t], "sentence", 500)), text)
+    bench("chunk_texts sentence (500 chars)", lambda t: chunk_texts(t, "sentence", 500), text)
+    bench("engine sentence (500, overlap 100)", lambda t: list(iter_chunks([t], "sentence", 500, 100)), text)
+    bench("legacy chunk_by_paragraphs", legacy_chunk_by_paragraphs, text)
+    bench("engine paragraph (600 chars)", lambda t: list(iter_chunks([t], "paragraph", 600)), text)
+    bench("chunk_texts paragraph (600 chars)", lambda t: chunk_texts(t, "paragraph", 600), text)
@@ -1,9 +1,11 @@
-from sentence_transformers import SentenceTransformer, util
+from ai_helpers import encode_chunks, encode_queries
+from similarity import SimilarityIndex
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
 sentences = ["Machine Learning is a subset of AI", "I visited Chennai last week."]
-embeddings = model.encode(sentences)
+# Cached by (model, text hash): re-runs skip the model for texts seen before
+index = SimilarityIndex(encode_chunks(sentences))
 
-query = model.encode("Tell me about Machine Learning")
-scores = util.cos_sim(query, embeddings)
-print(scores)
\ No newline at end of file
+query = encode_queries(["Tell me about Machine Learning"])
+scores, ranked = index.search(query, k=len(sentences))
+for score, i in zip(scores[0], ranked[0]):
+    print(f"{score:.4f}  {sentences[i]}")
\ No newline at end of file
@@ -1,66 +1,65 @@
+import asyncio
+import json
 import os
-from typing import List, Dict
-from fastapi import FastAPI, Query
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from chromadb.config import Settings
 import streamlit as st
 from openai import OpenAI
-import hashlib
-from ai_helpers import chunk_exists_in_vectordb
 
 # helpers
 from ai_helpers import (
-    read_pdfs,
-    clean_text,
-    chunk_text,
-    store_chunks,
-    query_chunks,
-    flatten_documents,
-    get_openai_response,
+    stream_ingest_pdfs,
+    query_chunks_batch,
+    query_chunks_by_embeddings,
+    encode_queries,
+    retrieve_context,
+    results_context,
+    rerank_results,
+    get_reranker,
+    stream_openai_response,
+    answer_latency_stats,
     save_uploaded_files,
+    warm_up_models,
+    model_registry_stats,
+    get_response_cache,
+    flush_vector_store,
 )
+from encode_batcher import EncodeBatcher
+from llm_client import llm_usage_stats
 
+# Rerank a wider candidate set with a cross-encoder before answering; fewer, better chunks
+USE_RERANKER = os.getenv("USE_RERANKER", "0") == "1"
 
 # ---- Small helper functions to keep UI readable ----
 def process_uploaded_files(files, upload_dir: str = "temp") -> bool:
-    """Save uploaded files, chunk them, de-duplicate by hash, and store new chunks.
+    """Save uploaded files and stream them page by page into the vector store.
 
-    Returns True if new chunks were added, False if nothing new.
+    Unchanged chunks are skipped, new ones are embedded and stored, and chunks that
+    vanished from a re-uploaded file are deleted. Returns True if anything changed.
     """
     pdf_paths = save_uploaded_files(files, upload_dir=upload_dir)
-    texts = read_pdfs(pdf_paths)
-    new_chunks, new_metadatas = [], []
-    for i, text in enumerate(texts):
-        cleaned = clean_text(text)
-        chunks = chunk_text(cleaned)
-        for chunk in chunks:
-            chunk_hash = hashlib.sha256(chunk.encode('utf-8')).hexdigest()
-            if not chunk_exists_in_vectordb(chunk_hash):
-                new_chunks.append(chunk)
-                new_metadatas.append({"source": pdf_paths[i], "hash": chunk_hash})
-
-    if new_chunks:
-        store_chunks(new_chunks, new_metadatas)
-        return True
-    return False
+    stats = stream_ingest_pdfs(pdf_paths)
+    return any(s["added"] or s["removed"] for s in stats.values())
 
 
 def retrieve_context_and_answer(query: str, progress) -> str | None:
     """Run retrieval and call LLM; return answer string or None if no context."""
     with st.spinner("Retrieving relevant chunks..."):
-        results = query_chunks(query, n_results=3)
+        # Fetch more candidates than fit; the builder keeps the best under the token budget
+        context = retrieve_context(query, n_results=4 if USE_RERANKER else 8, rerank=USE_RERANKER)
     progress.progress(40)
-    raw_docs = results.get('documents', [])
-    flat_docs = flatten_documents(raw_docs)
-    context = " ".join(flat_docs)
 
     # Debug info
     try:
-        st.write(f"Context length (chars): {len(context)}")
+        st.write(f"Context: {len(context.sources)} chunks, {context.tokens} tokens "
+                 f"({context.dropped_duplicates} duplicates, {context.dropped_over_budget} over budget dropped)")
     except Exception:
         pass
 
-    if not context.strip():
+    if not context.sources:
         return None
 
     api_key = os.getenv("OPENAI_API_KEY")
@@ -69,10 +68,22 @@ def retrieve_context_and_answer(query: str, progress) -> str | None:
         return None
 
     try:
-        with st.spinner("Generating answer from the model..."):
-            progress.progress(60)
-            answer = get_openai_response(context, query, api_key)
-            progress.progress(100)
+        progress.progress(60)
+        # Render deltas as they arrive so the first words show up well before the answer is done
+        placeholder = st.empty()
+        metrics = {}
+        answer = ""
+        for delta in stream_openai_response(context, query, api_key, metrics=metrics):
+            answer += delta
+            placeholder.markdown(f"**Answer:** {answer}")
+        progress.progress(100)
+        st.caption("Sources: " + "; ".join(
+            f"[{src.tag}] {os.path.basename(src.source or '?')}" + (f" p. {src.page}" if src.page is not None else "")
+            for src in context.sources))
+        if metrics.get("ttft_seconds") is not None:
+            rate = metrics.get("tokens_per_second")
+            st.caption(f"First token after {metrics['ttft_seconds']:.2f}s"
+                       + (f", {rate:.0f} tokens/s" if rate else ""))
         return answer
     except Exception as e:
         st.error(f"OpenAI API error: {e}")
@@ -102,15 +113,134 @@ _HIDE_STREAMLIT_STYLE = """
 # ----------- Step 4: FastAPI for Semantic Search -----------
 app = FastAPI()
 
+
+# Concurrent /search requests share encode passes on a dedicated worker pool
+_query_batcher = EncodeBatcher(encode_queries, max_batch_size=64, max_wait_ms=3, workers=2)
+
+
+@app.on_event("startup")
+def load_embedding_model():
+    # Load the embedding model once so the first /search doesn't pay for it
+    warm_up_models()
+
+
+@app.on_event("shutdown")
+def stop_encode_workers():
+    _query_batcher.close()
+    flush_vector_store()
+
+
 class SearchRequest(BaseModel):
     query: str
 
 @app.post("/search")
-def search(request: SearchRequest):
-    # Use helper to query stored chunks
-    results = query_chunks(request.query, n_results=5)
+async def search(request: SearchRequest):
+    # Encoding is micro-batched off the event loop; the store query runs in a thread
+    query_emb = await _query_batcher.encode(request.query)
+    results = await asyncio.to_thread(query_chunks_by_embeddings, [query_emb], 5)
     return {"results": results.get('documents', []), "metadatas": results.get('metadatas', [])}
 
+
+@app.get("/stats/search")
+def search_stats():
+    return _query_batcher.metrics()
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    n_results: int = 5
+    where: Optional[Dict[str, Any]] = None
+    include: List[str] = ["documents", "metadatas", "distances"]
+    mode: str = "dense"
+
+
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest):
+    # One encode pass and one vector-store query for the whole batch
+    try:
+        results = query_chunks_batch(request.queries, n_results=request.n_results,
+                                     where=request.where, include=request.include, mode=request.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fields = ["ids", *request.include, "scores"]
+    return {"results": [
+        {"query": query, **{field: results[field][i] for field in fields if results.get(field) is not None}}
+        for i, query in enumerate(request.queries)
+    ]}
+
+
+@app.get("/stats/models")
+def model_stats():
+    return model_registry_stats()
+
+
+class AnswerRequest(BaseModel):
+    query: str
+    n_results: int = 8
+    mode: str = "dense"
+    rerank: bool = False
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/answer/stream")
+async def answer_stream(request: AnswerRequest):
+    """Answer from retrieved context as server-sent events: `delta` events, then `done` with timings."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise HTTPException(status_code=503, detail="OPENAI_API_KEY is not set")
+    # with reranking, retrieve a wider candidate set for the cross-encoder to cut down
+    fetch = request.n_results * 4 if request.rerank else request.n_results
+    if request.mode == "dense":
+        query_emb = await _query_batcher.encode(request.query)
+        results = await asyncio.to_thread(query_chunks_by_embeddings, [query_emb], fetch)
+    else:
+        try:
+            results = await asyncio.to_thread(query_chunks_batch, [request.query], fetch, mode=request.mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if request.rerank:
+        results = await asyncio.to_thread(rerank_results, request.query, results, request.n_results)
+    context = results_context(results)
+    if not context.sources:
+        raise HTTPException(status_code=404, detail="No relevant context found for your query.")
+
+    def events():
+        metrics = {}
+        try:
+            for delta in stream_openai_response(context, request.query, api_key, metrics=metrics):
+                yield _sse("delta", {"text": delta})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {**metrics, "sources": [src._asdict() for src in context.sources]})
+
+    # A sync generator: Starlette iterates it in its threadpool, off the event loop
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/stats/answers")
+def answer_stats():
+    return answer_latency_stats()
+
+
+@app.get("/stats/responses")
+def response_stats():
+    return get_response_cache().stats()
+
+
+@app.get("/stats/rerank")
+def rerank_stats():
+    return get_reranker().stats()
+
+
+@app.get("/stats/llm")
+def llm_stats():
+    return llm_usage_stats()
+
 # ----------- Step 5: Streamlit UI with LLM -----------
 def streamlit_ui():
     # hide Streamlit menu items and set UI
@@ -119,6 +249,9 @@ def streamlit_ui():
     except Exception:
         pass
     st.title("AI Agent PDF Semantic Search")
+    # Shared across Streamlit reruns; only the first run actually loads the model
+    with st.spinner("Loading embedding model..."):
+        warm_up_models()
 
     # Ensure session state flag
     if 'has_docs' not in st.session_state:
@@ -129,9 +262,9 @@ def streamlit_ui():
         files = uploaded_files if isinstance(uploaded_files, list) else [uploaded_files]
         added = process_uploaded_files(files)
         if added:
-            st.success("New unique chunks processed and stored in ChromaDB.")
+            st.success("New or changed chunks processed and stored in ChromaDB.")
         else:
-            st.info("No new unique chunks to add. All chunks already exist in the database.")
+            st.info("No changes to store. All chunks already exist in the database.")
         st.session_state['has_docs'] = True
 
     if not st.session_state.get('has_docs', False):
@@ -144,11 +277,10 @@ def streamlit_ui():
 
     # Show progress & handle query/answer
     progress = st.progress(0)
+    # The answer is rendered while it streams in
     answer = retrieve_context_and_answer(query, progress)
     if answer is None:
         st.warning("No relevant context found for your query.")
-    else:
-        st.write("Answer:", answer)
 
 # To run Streamlit UI: 
 if __name__ == "__main__":
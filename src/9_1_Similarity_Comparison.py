@@ -1,5 +1,7 @@
 import logging
-from sentence_transformers import SentenceTransformer, util
+from ai_helpers import encode_chunks, encode_queries
+from chunking import chunk_texts
+from similarity import SimilarityIndex
 import re
 from pypdf import PdfReader
 import chromadb
@@ -7,8 +9,7 @@ import chromadb
 # Set logging level to ERROR to suppress warnings
 logging.getLogger("pypdf").setLevel(logging.ERROR)
 
-# Initialize model and ChromaDB
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Open the source PDF
 reader = PdfReader("/Users/mathivanan/Downloads/Building AI Agents - A Practical Beginners Guide.pdf")
 
 # Read PDF and extract text
@@ -18,31 +19,9 @@ for page in reader.pages:
 
 # Chunk by paragraphs FIRST (before cleaning)
 def chunk_by_paragraphs(text):
-    # Split by single newlines and group into meaningful chunks
-    lines = text.split('\n')
-    chunks = []
-    current_chunk = ""
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Add line to current chunk
-        current_chunk += line + " "
-        
-        # Create new chunk when we reach good size (300-600 chars)
-        if len(current_chunk) >= 300:
-            # Look for sentence ending
-            if line.endswith(('.', '!', '?')):
-                chunks.append(current_chunk.strip())
-                current_chunk = ""
-    
-    # Add remaining chunk
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    return chunks
+    # Group lines into paragraph chunks of up to ~600 chars, cutting where a line
+    # ends a sentence; single pass, no repeated string concatenation
+    return chunk_texts(text, strategy="paragraph", chunk_size=600)
 
 chunks = chunk_by_paragraphs(text)
 
@@ -82,19 +61,19 @@ def embeddingAndSearch_with_chromadb(chunks):
     
 # Manual embedding and similarity search without ChromaDB
 def manual_embedding_search(chunks):
-    # Embed all the chunks
-    embeddings = model.encode(chunks)
+    # Embed all the chunks (cached on disk across runs) and normalise them once
+    index = SimilarityIndex(encode_chunks(chunks))
 
     # Embed the query
-    query_embedding = model.encode([query])
+    query_embedding = encode_queries([query])
 
-    # Compute cosine similarities
-    scores = util.cos_sim(query_embedding, embeddings)  
+    # Cosine similarity via one matrix product; top 10 via argpartition
+    scores, top_idx = index.search(query_embedding, k=10)
 
     # Find best match
-    best_idx = scores.argmax()
+    best_idx = top_idx[0][0]
     print("Best match:", chunks[best_idx])
-    print("Score:", scores[0][best_idx].item())
+    print("Score:", scores[0][0].item())
     
 # benchmarking manual embedding 
 
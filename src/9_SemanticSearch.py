@@ -1,16 +1,14 @@
-from sentence_transformers import SentenceTransformer, util
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
+from ai_helpers import encode_chunks, encode_queries
+from similarity import SimilarityIndex
 
 notes = [
 "Python is great for AI applications.",
 "Chennai is a coastal city in Tamil Nadu.",
 "Transformers power modern AI models."
 ]
-vecs = model.encode(notes)
+# Normalised once; each query is then a single matrix product
+index = SimilarityIndex(encode_chunks(notes))
 
 query = input("Ask something: ") # I am an Indian Citizen
-query_vec = model.encode(query)
-scores = util.cos_sim(query_vec, vecs)
-best = scores.argmax()
-print("Match:", notes[best])
\ No newline at end of file
+scores, best = index.search(encode_queries([query]), k=1)
+print("Match:", notes[best[0][0]])
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Bounded working memory for the ReAct loop.
+
+Steps are kept as typed records with their token counts. Once the rendered state
+passes `max_tokens`, all but the `keep_recent` newest steps are folded into a running
+summary. That summary is itself capped, so the prompt stays roughly constant in size
+however long the agent runs, instead of re-sending an ever-growing transcript.
+"""
+from typing import Callable, List, NamedTuple
+
+from context_builder import count_tokens, trim_to_budget
+from llm_client import LLMClient
+
+
+class AgentStep(NamedTuple):
+    step: int
+    tool: str
+    arg: str
+    status: str
+    observation: str
+    tokens: int  # of render()
+
+    def render(self) -> str:
+        return f"Action: {self.tool}[{self.arg}]\nObservation: {self.observation}"
+
+
+# (previous summary, steps to fold in) -> new summary
+Summarizer = Callable[[str, List[AgentStep]], str]
+
+
+def extractive_summary(previous: str, steps: List[AgentStep], max_chars: int = 160) -> str:
+    """One line per step: the call and the start of its observation. No model call."""
+    lines = [previous] if previous else []
+    for s in steps:
+        observation = " ".join(s.observation.split())
+        if len(observation) > max_chars:
+            observation = observation[:max_chars] + "..."
+        lines.append(f"- step {s.step}: {s.tool}[{s.arg}] ({s.status}): {observation}")
+    return "\n".join(lines)
+
+
+def llm_summarizer(client: LLMClient, model: str = "gpt-4.1-mini", max_tokens: int = 300) -> Summarizer:
+    """A Summarizer that asks the model to merge new steps into the running summary."""
+    def summarize(previous: str, steps: List[AgentStep]) -> str:
+        transcript = "\n".join(s.render() for s in steps)
+        resp = client.create(model=model, max_tokens=max_tokens, messages=[
+            {"role": "system", "content": "Summarise an agent's tool calls and findings. Keep every number, "
+                                          "name and fact that could matter for the goal; drop everything else."},
+            {"role": "user", "content": f"Summary so far:\n{previous or '(none)'}\n\nNew steps:\n{transcript}"},
+        ])
+        return (resp.choices[0].message.content or "").strip()
+    return summarize
+
+
+class AgentMemory:
+    """Goal, a capped summary of older steps, and the most recent steps verbatim.
+
+    Observations longer than `max_observation_tokens` are cut when added. `compact`
+    folds old steps into the summary once the state exceeds `max_tokens`, and the
+    summary is kept to `max_tokens // 3` (its most recent part survives).
+    """
+
+    def __init__(self, goal: str, max_tokens: int = 2000, keep_recent: int = 3, max_observation_tokens: int = 400,
+                 summarize: Summarizer = extractive_summary, model: str = "gpt-4.1-mini"):
+        self.goal = goal
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.max_observation_tokens = max_observation_tokens
+        self.summarize = summarize
+        self.model = model
+        self.steps: List[AgentStep] = []
+        self.summary = ""
+        self.compactions = 0
+        self._fixed_tokens = count_tokens([f"Goal: {goal}"], model)[0]
+        self._summary_tokens = 0
+
+    @property
+    def tokens(self) -> int:
+        return self._fixed_tokens + self._summary_tokens + sum(s.tokens for s in self.steps)
+
+    def add(self, step: int, tool: str, arg: str, status: str, observation: str) -> AgentStep:
+        observation = trim_to_budget(observation, self.model, self.max_observation_tokens, keep_end=False)
+        record = AgentStep(step, tool, arg, status, observation, 0)
+        record = record._replace(tokens=count_tokens([record.render()], self.model)[0])
+        self.steps.append(record)
+        return record
+
+    def compact(self) -> bool:
+        """Fold older steps into the summary if over budget; returns True if it did.
+
+        May call the summarizer (and so the model); run it off the event loop.
+        """
+        if self.tokens <= self.max_tokens or len(self.steps) <= self.keep_recent:
+            return False
+        cut = len(self.steps) - self.keep_recent
+        old, self.steps = self.steps[:cut], self.steps[cut:]
+        summary = self.summarize(self.summary, old)
+        self.summary = trim_to_budget(summary, self.model, max(1, self.max_tokens // 3))
+        self._summary_tokens = count_tokens([self.summary], self.model)[0] if self.summary else 0
+        self.compactions += 1
+        return True
+
+    def render(self) -> str:
+        parts = [f"Goal: {self.goal}"]
+        if self.summary:
+            parts.append(f"Summary of earlier steps:\n{self.summary}")
+        parts.extend(s.render() for s in self.steps)
+        return "\n".join(parts)
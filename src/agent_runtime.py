@@ -0,0 +1,248 @@
+"""Asyncio ReAct loop: several tool calls per turn, run concurrently with timeouts.
+
+The model may request any number of tool calls in one turn, either as native
+function calls (`protocol="native"`) or as `Action: Tool[arg]` lines (`"text"`;
+also accepted as a fallback in native mode). Those calls are independent by
+construction (none can see another's result), so they run concurrently and the turn
+takes as long as the slowest tool rather than their sum. `run_agent` is an async
+generator of `AgentEvent`s, so callers can render progress while the loop runs.
+"""
+import asyncio
+import json
+import re
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from agent_memory import AgentMemory, Summarizer, extractive_summary
+from context_builder import count_tokens
+from llm_client import LLMClient
+from tool_cache import ToolCache
+from tool_registry import ToolRegistry
+
+Tool = Callable[[str], object]
+
+_FINISH = re.compile(r"Finish:\s*(.*)", re.IGNORECASE | re.DOTALL)
+_ACTION = re.compile(r"Action:\s*(\w+)\s*\[(.*?)\]", re.IGNORECASE | re.DOTALL)
+_ACTION_WORD = re.compile(r"\bAction\s*:", re.IGNORECASE)
+
+SYSTEM_PROMPTS = {
+    "text": (
+        "You are an agent that can call tools.\n"
+        "To call tools, respond with one or more lines, each exactly: Action: <ToolName>[<argument>]\n"
+        "Actions in the same response run in parallel and cannot see each other's results, "
+        "so only group calls that are independent.\n"
+        "When you are finished and want to return a final answer, respond with: Finish: <answer>\n"
+        "Available tools: {tools}.\n"
+        "Only use the tools when necessary. Keep reasoning concise."
+    ),
+    "native": (
+        "You are an agent that can call tools.\n"
+        "Call the provided functions when you need them. Calls made in the same reply run in parallel "
+        "and cannot see each other's results, so only group calls that are independent.\n"
+        "When you are finished and want to return a final answer, reply with: Finish: <answer>\n"
+        "Only use the tools when necessary. Keep reasoning concise."
+    ),
+}
+REPAIR_PROMPT = (
+    "Your previous reply could not be used: {problem}.\n"
+    "Previous reply:\n{reply}\n\n"
+    "Reply again, either calling tools with valid arguments or with: Finish: <answer>"
+)
+
+
+class AgentEvent(NamedTuple):
+    kind: str  # "llm", "repair", "action", "observation", "finish" or "stopped"
+    step: int
+    data: Dict
+
+
+class ToolCall(NamedTuple):
+    tool: str
+    args: Any  # validated arguments for known tools, the raw argument otherwise
+    arg: str  # display/cache form of the arguments
+
+
+class ParsedTurn(NamedTuple):
+    answer: Optional[str]
+    calls: List[ToolCall]
+    problem: Optional[str]  # why the reply is unusable, if it is
+
+
+@lru_cache(maxsize=256)
+def parse_actions(response: str) -> Tuple[Optional[str], Tuple[Tuple[str, str], ...]]:
+    """Return (final answer or None, ((tool, argument), ...)) from a text-protocol reply."""
+    finish = _FINISH.search(response)
+    if finish:
+        return finish.group(1).strip(), ()
+    return None, tuple((name, arg.strip()) for name, arg in _ACTION.findall(response))
+
+
+def _tool_call(registry: ToolRegistry, name: str, args: Any, raw: str) -> Tuple[ToolCall, Optional[str]]:
+    spec = registry.get(name)
+    if spec is None:
+        # not a format problem: the model gets an "unknown tool" observation instead
+        return ToolCall(name, raw, raw), None
+    problem = spec.validate(args)
+    return ToolCall(name, args, spec.format_args(args) if problem is None else raw), problem
+
+
+def parse_reply(message, registry: ToolRegistry, native: bool) -> ParsedTurn:
+    """Read tool calls or a final answer from a chat completion message."""
+    calls, problems = [], []
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        name, raw = tool_call.function.name, tool_call.function.arguments or "{}"
+        try:
+            args = json.loads(raw)
+        except ValueError:
+            problems.append(f"the arguments of {name} are not valid JSON")
+            continue
+        call, problem = _tool_call(registry, name, args, raw)
+        calls.append(call)
+        problems.extend([problem] if problem else [])
+    text = (message.content or "").strip()
+    if not calls and not problems:
+        answer, actions = parse_actions(text)
+        if answer is not None:
+            return ParsedTurn(answer, [], None)
+        for name, raw in actions:
+            spec = registry.get(name)
+            call, problem = _tool_call(registry, name, spec.text_args(raw) if spec else raw, raw)
+            calls.append(call)
+            problems.extend([problem] if problem else [])
+        if not calls and not problems:
+            if native and text and not _ACTION_WORD.search(text):
+                # function-calling models often just answer in prose when done
+                return ParsedTurn(text, [], None)
+            problems.append("it contains neither a tool call nor 'Finish: <answer>'" if text else "it was empty")
+    return ParsedTurn(None, calls, "; ".join(problems) if problems else None)
+
+
+async def _observe(step: int, call: ToolCall, registry: ToolRegistry, timeout: float) -> AgentEvent:
+    started = time.perf_counter()
+    spec = registry.get(call.tool)
+    if spec is None:
+        status, observation = "unknown_tool", f"Unknown tool requested: {call.tool}"
+    else:
+        try:
+            if spec.is_async:
+                result = await asyncio.wait_for(spec.fn(**call.args), timeout)
+            else:
+                # On timeout the thread cannot be killed; it finishes in the background and is ignored
+                result = await asyncio.wait_for(asyncio.to_thread(spec.fn, **call.args), timeout)
+            status, observation = "ok", str(result)
+        except asyncio.TimeoutError:
+            status, observation = "timeout", f"Tool {call.tool} timed out after {timeout:g}s"
+        except Exception as e:
+            status, observation = "error", f"Tool execution error: {e}"
+    return AgentEvent("observation", step, {"tool": call.tool, "arg": call.arg, "status": status,
+                                            "observation": observation, "seconds": time.perf_counter() - started})
+
+
+async def run_agent(goal: str, tools: Union[ToolRegistry, Dict[str, Tool]], client: LLMClient,
+                    model: str = "gpt-4.1-mini", max_steps: int = 5, tool_timeout: float = 10.0,
+                    timeouts: Optional[Dict[str, float]] = None, tool_descriptions: Optional[Dict[str, str]] = None,
+                    memory_tokens: int = 2000, summarize: Optional[Summarizer] = None,
+                    cache: Optional[ToolCache] = None, protocol: str = "native") -> AsyncIterator[AgentEvent]:
+    """Run the ReAct loop for `goal`, yielding events as they happen.
+
+    `tools` is a ToolRegistry, or a dict of single-string tools (described by
+    `tool_descriptions`). `timeouts` overrides `tool_timeout` per tool. Observations
+    of one turn are yielded as each tool finishes, and recorded in the order the model
+    asked for them. The state sent to the model is an AgentMemory capped at about
+    `memory_tokens`; each "llm" event reports the prompt size of its step.
+
+    A reply that cannot be parsed, or whose arguments do not match the tool schema,
+    gets one "repair" request telling the model what was wrong before the run stops.
+
+    Tool results are looked up in `cache` (a fresh per-run ToolCache by default;
+    pass a shared one to reuse results across runs). Identical calls in one turn run
+    once, and an action the run already executed is answered from the cache with
+    status "repeated" and a note telling the model so.
+    """
+    if protocol not in SYSTEM_PROMPTS:
+        raise ValueError(f"Unknown protocol {protocol!r}; expected one of {tuple(SYSTEM_PROMPTS)}")
+    registry = tools if isinstance(tools, ToolRegistry) else ToolRegistry.from_callables(tools, tool_descriptions)
+    native = protocol == "native"
+    timeouts = timeouts or {}
+    system_prompt = SYSTEM_PROMPTS[protocol].format(tools=registry.describe())
+    extra = {"tools": registry.definitions()} if native else {}
+    memory = AgentMemory(goal, max_tokens=memory_tokens, summarize=summarize or extractive_summary)
+    cache = cache if cache is not None else ToolCache()
+    executed: Dict[Tuple[str, str], int] = {}  # cache key -> step that first ran it
+
+    for step in range(1, max_steps + 1):
+        user_message = f"Current state:\n{memory.render()}\nDecide next action (Action[...] or Finish: ...):"
+        turn = None
+        for attempt in range(2):
+            prompt_tokens = sum(count_tokens([system_prompt, user_message], model))
+            started = time.perf_counter()
+            try:
+                # The shared client is synchronous (and rate limited); keep it off the event loop
+                resp = await asyncio.to_thread(
+                    client.create, model=model, **extra,
+                    messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}],
+                )
+                message = resp.choices[0].message
+            except Exception as e:
+                yield AgentEvent("stopped", step, {"reason": f"OpenAI API error: {e}"})
+                return
+            reply = "\n".join(filter(None, [(message.content or "").strip()] + [
+                f"{c.function.name}({c.function.arguments})" for c in getattr(message, "tool_calls", None) or []]))
+            yield AgentEvent("llm", step, {"response": reply, "seconds": time.perf_counter() - started,
+                                           "prompt_tokens": prompt_tokens, "memory_steps": len(memory.steps),
+                                           "compactions": memory.compactions})
+            turn = parse_reply(message, registry, native)
+            if turn.problem is None or attempt == 1:
+                break
+            yield AgentEvent("repair", step, {"problem": turn.problem})
+            user_message += "\n\n" + REPAIR_PROMPT.format(problem=turn.problem, reply=reply)
+
+        if turn.answer is not None:
+            yield AgentEvent("finish", step, {"answer": turn.answer})
+            return
+        if turn.problem is not None:
+            yield AgentEvent("stopped", step, {"reason": f"No usable action after a repair request: {turn.problem}"})
+            return
+
+        for call in turn.calls:
+            yield AgentEvent("action", step, {"tool": call.tool, "arg": call.arg})
+        calls: Dict[Tuple[str, str], ToolCall] = {}  # identical calls in this turn run once
+        for call in turn.calls:
+            calls.setdefault(cache.key(call.tool, call.arg), call)
+        observed: Dict[Tuple[str, str], AgentEvent] = {}
+        tasks: Dict[asyncio.Future, Tuple[str, str]] = {}
+        for key, call in calls.items():
+            hit = cache.get(call.tool, call.arg) if call.tool in registry else None
+            if hit is None:
+                task = asyncio.ensure_future(_observe(step, call, registry, timeouts.get(call.tool, tool_timeout)))
+                tasks[task] = key
+            elif key in executed:
+                observed[key] = AgentEvent("observation", step, {
+                    "tool": call.tool, "arg": call.arg, "status": "repeated", "seconds": 0.0,
+                    "observation": f"{hit} (same result as step {executed[key]}; repeating this action will not change it)"})
+            else:
+                observed[key] = AgentEvent("observation", step, {
+                    "tool": call.tool, "arg": call.arg, "status": "cached", "observation": hit, "seconds": 0.0})
+        for event in observed.values():
+            yield event
+        try:
+            for finished in asyncio.as_completed(list(tasks)):
+                event = await finished
+                if event.data["status"] == "ok":
+                    cache.put(event.data["tool"], event.data["arg"], event.data["observation"])
+                yield event
+        finally:
+            # only does anything if the caller stopped consuming events mid-turn
+            for task in tasks:
+                task.cancel()
+        for task, key in tasks.items():
+            observed[key] = task.result()
+        for key in calls:
+            data = observed[key].data
+            memory.add(step, data["tool"], data["arg"], data["status"], data["observation"])
+            executed.setdefault(key, step)
+        # the summarizer may call the model
+        await asyncio.to_thread(memory.compact)
+
+    yield AgentEvent("stopped", max_steps, {"reason": "Reached max steps without a Finish action"})
@@ -0,0 +1,222 @@
+"""Single-pass chunking engine with sentence/paragraph strategies.
+
+Text is split into units (sentences or paragraphs) which are packed greedily into
+chunks under a size budget. Sizes come from a `count` callable, so the budget can be
+characters or embedding-model tokens. Every chunk carries its [start, end) span in
+the source text, and consecutive chunks can share up to `overlap` worth of units.
+"""
+import math
+import re
+from collections import deque
+from typing import Callable, Deque, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# A boundary separates two units. Leading punctuation of a match stays at the end of
+# the preceding unit; the rest of the match (whitespace) is dropped.
+_BOUNDARIES = {
+    # sentence-ending punctuation, optionally a closing quote/bracket, then whitespace
+    "sentence": re.compile(r"[.!?][\"')\]]?\s+"),
+    # a blank line, or a line that ends a sentence (the cue chunk_by_paragraphs used);
+    # the leading character class lets the regex engine skip ahead quickly
+    "paragraph": re.compile(r"[\n.!?](?:(?<=\n)[ \t]*\n\s*|(?<=[.!?])[ \t]*\n\s*)"),
+}
+_KEEP = frozenset(".!?\"')]")
+# The same boundaries for re.split, capturing the leading character(s) the unit keeps
+# (a captured newline is stripped off again with the rest of the whitespace)
+_SPLITTERS = {
+    "sentence": re.compile(r"([.!?][\"')\]]?)\s+"),
+    "paragraph": re.compile(r"([\n.!?])(?:(?<=\n)[ \t]*\n\s*|(?<=[.!?])[ \t]*\n\s*)"),
+}
+_WHITESPACE = re.compile(r"\s")
+_UNIT_BLOCK = 2048
+
+Counter = Callable[[List[str]], List[int]]
+
+
+class Chunk(NamedTuple):
+    text: str  # whitespace-normalised source[start:end]
+    start: int
+    end: int
+
+
+def count_chars(texts: List[str]) -> List[int]:
+    # +1 for the separator that joins this unit to the next one
+    return [len(t) + 1 for t in texts]
+
+
+class Chunker:
+    """Incremental chunker: `feed` text pieces, then `finish`; both yield Chunks.
+
+    Only the unfinished trailing unit and the units of the current chunk are held
+    in memory, so it can run over a stream of pages.
+    """
+
+    def __init__(self, strategy: str = "sentence", chunk_size: int = 500, overlap: int = 0,
+                 count: Optional[Counter] = None):
+        if strategy not in _BOUNDARIES:
+            raise ValueError(f"Unknown chunking strategy: {strategy!r}")
+        if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+            raise ValueError("chunk_size must be positive and 0 <= overlap < chunk_size")
+        self.boundary = _BOUNDARIES[strategy]
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.count = count or count_chars
+        self._buffer = ""
+        self._buffer_start = 0
+        self._units: Deque[Tuple[int, int, int]] = deque()  # (start, end, size) of the current chunk
+        self._units_text: Deque[str] = deque()
+        self._total = 0
+        self._fresh = False  # current chunk has units not emitted yet
+
+    def feed(self, text: str) -> Iterator[Chunk]:
+        self._buffer += text
+        buffer = self._buffer
+        spans, last_end = [], 0
+        for match in self.boundary.finditer(buffer):
+            end = match.start()
+            while buffer[end] in _KEEP:
+                end += 1
+            spans.append((last_end, end))
+            last_end = match.end()
+        if spans:
+            chunks = self._add_units(spans)
+            self._buffer_start += last_end
+            self._buffer = buffer[last_end:]
+            yield from chunks
+
+    def finish(self) -> Iterator[Chunk]:
+        chunks = self._add_units([(0, len(self._buffer))]) if self._buffer else []
+        self._buffer_start += len(self._buffer)
+        self._buffer = ""
+        if self._fresh:
+            chunks.append(self._emit())
+        self._units.clear()
+        self._units_text.clear()
+        self._total = 0
+        self._fresh = False
+        yield from chunks
+
+    def _add_units(self, spans: List[Tuple[int, int]]) -> List[Chunk]:
+        buffer, offset = self._buffer, self._buffer_start
+        units = []
+        for start, end in spans:
+            text = buffer[start:end]
+            if not text:
+                continue
+            if text[0].isspace() or text[-1].isspace():
+                stripped = text.strip()
+                if not stripped:
+                    continue
+                start += len(text) - len(text.lstrip())
+                text = stripped
+            units.append((offset + start, text))
+        chunks: List[Chunk] = []
+        chunk_size = self.chunk_size
+        for block in range(0, len(units), _UNIT_BLOCK):
+            batch = units[block:block + _UNIT_BLOCK]
+            for (start, text), size in zip(batch, self.count([t for _, t in batch])):
+                if size > chunk_size:
+                    self._add_oversized(start, text, size, chunks)
+                else:
+                    self._add(start, text, size, chunks)
+        return chunks
+
+    def _add_oversized(self, start: int, text: str, size: int, out: List[Chunk]) -> None:
+        for offset, piece, part_size in _split_oversized(text, size, self.chunk_size, self.count):
+            self._add(start + offset, piece, part_size, out)
+
+    def _add(self, start: int, text: str, size: int, out: List[Chunk]) -> None:
+        units = self._units
+        if units and self._total + size > self.chunk_size:
+            if self._fresh:
+                out.append(self._emit())
+            # Keep trailing units as overlap, as long as the new unit still fits
+            while units and (self._total > self.overlap or self._total + size > self.chunk_size):
+                self._total -= units.popleft()[2]
+                self._units_text.popleft()
+        units.append((start, start + len(text), size))
+        self._units_text.append(text)
+        self._total += size
+        self._fresh = True
+
+    def _emit(self) -> Chunk:
+        self._fresh = False
+        text = " ".join(" ".join(self._units_text).split())
+        return Chunk(text, self._units[0][0], self._units[-1][1])
+
+
+def _split_oversized(text: str, size: int, chunk_size: int, count: Counter) -> List[Tuple[int, str, int]]:
+    """Cut a unit that alone exceeds the budget into (offset, piece, size) parts that fit.
+
+    Parts are roughly equal and cut at whitespace; a stretch without whitespace (a URL,
+    a table row run together) is cut mid-word. Parts still over the budget, e.g. when
+    tokens are not spread evenly, are cut again.
+    """
+    if len(text) == 1:
+        return [(0, text, size)]  # cannot be cut any further
+    parts, step, cut = [], len(text) / math.ceil(size / chunk_size), 0
+    while cut < len(text):
+        target = int(cut + step)
+        if target >= len(text):
+            end = nxt = len(text)
+        else:
+            space = _WHITESPACE.search(text, target, int(cut + 2 * step))
+            end = space.start() if space else max(target, cut + 1)
+            nxt = end + 1 if space else end
+        raw = text[cut:end]
+        piece = raw.strip()
+        if piece:
+            parts.append((cut + len(raw) - len(raw.lstrip()), piece))
+        cut = nxt
+    out = []
+    for (offset, piece), part_size in zip(parts, count([p for _, p in parts])):
+        if part_size > chunk_size:
+            out.extend((offset + sub_offset, sub_piece, sub_size) for sub_offset, sub_piece, sub_size
+                       in _split_oversized(piece, part_size, chunk_size, count))
+        else:
+            out.append((offset, piece, part_size))
+    return out
+
+
+def chunk_texts(text: str, strategy: str = "sentence", chunk_size: int = 500) -> List[str]:
+    """The texts of `iter_chunks([text], strategy, chunk_size)`, about twice as fast.
+
+    Covers the common case of a character budget without overlap or spans: units come
+    from one `re.split` and are packed without keeping per-unit records.
+    """
+    if strategy not in _SPLITTERS:
+        raise ValueError(f"Unknown chunking strategy: {strategy!r}")
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    chunks: List[str] = []
+    current: List[str] = []
+    total = 0
+    pieces = _SPLITTERS[strategy].split(text)
+    pieces.append("")
+    for unit, kept in zip(pieces[0::2], pieces[1::2]):
+        unit = (unit + kept).strip()
+        if not unit:
+            continue
+        size = len(unit) + 1
+        parts = [(unit, size)] if size <= chunk_size else [
+            (piece, part_size) for _, piece, part_size in _split_oversized(unit, size, chunk_size, count_chars)]
+        for piece, part_size in parts:
+            if "  " in piece or not piece.isprintable():
+                # every whitespace character but " " is unprintable
+                piece = " ".join(piece.split())
+            if current and total + part_size > chunk_size:
+                chunks.append(" ".join(current))
+                current, total = [], 0
+            current.append(piece)
+            total += part_size
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def iter_chunks(pieces: Iterable[str], strategy: str = "sentence", chunk_size: int = 500, overlap: int = 0,
+                count: Optional[Counter] = None) -> Iterator[Chunk]:
+    """Chunk the concatenation of `pieces`; spans index into "".join(pieces)."""
+    chunker = Chunker(strategy, chunk_size, overlap, count)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.finish()
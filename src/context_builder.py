@@ -0,0 +1,134 @@
+"""Token-budgeted prompt context from retrieved chunks.
+
+Each chunk is tokenised once (tiktoken encoders are cached per model). Chunks are
+packed best-first under the model's context budget, near-duplicates are dropped, and
+every kept chunk gets a numbered source tag the model can cite.
+"""
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+# Tokens of retrieved context per prompt, by model-name prefix (longest match wins)
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-4": 6000,
+    "gpt-4-turbo": 12000,
+    "gpt-4o": 12000,
+    "gpt-4.1": 12000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# A chunk whose word shingles are mostly already in the context adds nothing
+DUPLICATE_SHINGLE_RATIO = float(os.getenv("CONTEXT_DUPLICATE_RATIO", "0.8"))
+_SHINGLE = 8
+_WORD = re.compile(r"\w+")
+
+
+class ContextSource(NamedTuple):
+    tag: int
+    source: Optional[str]
+    page: Optional[int]
+    tokens: int
+    distance: Optional[float]
+
+
+class BuiltContext(NamedTuple):
+    text: str
+    sources: List[ContextSource]
+    tokens: int
+    dropped_duplicates: int
+    dropped_over_budget: int
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str):
+    """The tiktoken encoding for `model`, or None if tiktoken is not installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(texts: List[str], model: str) -> List[int]:
+    encoder = get_encoder(model)
+    if encoder is None:
+        # ~4 characters per token for English text
+        return [len(t) // 4 + 1 for t in texts]
+    return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts)]
+
+
+def context_budget(model: str) -> int:
+    matches = [prefix for prefix in CONTEXT_TOKEN_BUDGETS if model.startswith(prefix)]
+    return CONTEXT_TOKEN_BUDGETS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_TOKEN_BUDGET
+
+
+def trim_to_budget(text: str, model: str, max_tokens: Optional[int] = None, keep_end: bool = True) -> str:
+    """Keep the last (or, with keep_end=False, first) `max_tokens` tokens of `text`, encoding it once."""
+    max_tokens = max_tokens or context_budget(model)
+    encoder = get_encoder(model)
+    if encoder is None:
+        return text[-max_tokens * 4:] if keep_end else text[:max_tokens * 4]
+    tokens = encoder.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[-max_tokens:] if keep_end else tokens[:max_tokens])
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < _SHINGLE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _tag_header(tag: int, metadata: Dict) -> str:
+    source = metadata.get("source")
+    if not source:
+        return f"[{tag}]"
+    page = metadata.get("page")
+    where = os.path.basename(str(source)) + (f", page {page}" if page is not None else "")
+    return f"[{tag}] ({where})"
+
+
+def build_context(documents: Sequence[str], metadatas: Optional[Sequence[Optional[Dict]]] = None,
+                  distances: Optional[Sequence[float]] = None, model: str = "gpt-3.5-turbo",
+                  max_tokens: Optional[int] = None) -> BuiltContext:
+    """Pack retrieved chunks (one query's results) into a tagged context string.
+
+    Chunks are taken in order of increasing distance (retrieval order if no
+    distances are given). A chunk is skipped if it is a near-duplicate of one already
+    packed, or if it does not fit the remaining budget; smaller, less relevant chunks
+    may still fill the space left.
+    """
+    max_tokens = max_tokens or context_budget(model)
+    metadatas = list(metadatas) if metadatas is not None else [None] * len(documents)
+    order = sorted(range(len(documents)),
+                   key=lambda i: distances[i] if distances is not None and distances[i] is not None else i)
+    order = [i for i in order if documents[i] and documents[i].strip()]
+    sizes = dict(zip(order, count_tokens([documents[i] for i in order], model)))
+
+    seen_shingles: set = set()
+    parts, sources = [], []
+    used = duplicates = over_budget = 0
+    for i in order:
+        shingles = _shingles(documents[i])
+        if shingles and len(shingles & seen_shingles) >= DUPLICATE_SHINGLE_RATIO * len(shingles):
+            duplicates += 1
+            continue
+        metadata = metadatas[i] or {}
+        header = _tag_header(len(sources) + 1, metadata)
+        # header and the blank line between chunks cost a few tokens each
+        cost = sizes[i] + len(header) // 4 + 2
+        if used + cost > max_tokens:
+            over_budget += 1
+            continue
+        seen_shingles |= shingles
+        used += cost
+        parts.append(f"{header}\n{documents[i].strip()}")
+        sources.append(ContextSource(len(sources) + 1, metadata.get("source"), metadata.get("page"), sizes[i],
+                                     distances[i] if distances is not None else None))
+    return BuiltContext("\n\n".join(parts), sources, used, duplicates, over_budget)
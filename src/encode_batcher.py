@@ -0,0 +1,100 @@
+"""Micro-batching of embedding requests for async servers.
+
+Concurrent requests that arrive within a few milliseconds of each other are encoded
+in one forward pass on a small dedicated thread pool, so the event loop never runs
+`model.encode` itself and the web server's threadpool is not tied up by it.
+"""
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+class EncodeBatcher:
+    """Collect `encode` calls into batches of up to `max_batch_size`.
+
+    The first request of a batch waits at most `max_wait_ms` for company; a full
+    queue (`max_queue`) makes callers wait, and at most `workers` batches are encoded
+    at once.
+    """
+
+    def __init__(self, encode_fn: EncodeFn, max_batch_size: int = 64, max_wait_ms: float = 5.0,
+                 workers: int = 2, max_queue: int = 4096):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encode")
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self._requests = 0
+        self._batches = 0
+        self._batch_sizes: Counter = Counter()
+
+    def _ensure_started(self) -> None:
+        # Created lazily so they bind to the server's running event loop
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._slots = asyncio.Semaphore(self.workers)
+            self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Return the embedding of `text`, computed together with concurrent requests."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        self._requests += 1
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.empty():
+                # give requests arriving right behind this one a chance to join
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._slots.acquire()
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        self._in_flight += 1
+        try:
+            texts = [text for text, _ in batch]
+            vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self.encode_fn, texts)
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            self._batches += 1
+            self._batch_sizes[len(batch)] += 1
+            self._slots.release()
+
+    def metrics(self) -> Dict:
+        """Queue depth, in-flight batches and the batch-size distribution so far."""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight_batches": self._in_flight,
+            "requests": self._requests,
+            "batches": self._batches,
+            "mean_batch_size": (sum(size * n for size, n in self._batch_sizes.items()) / self._batches
+                                if self._batches else 0.0),
+            "batch_sizes": dict(sorted(self._batch_sizes.items())),
+        }
+
+    def close(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,186 @@
+"""BM25 inverted index over stored chunks, and reciprocal-rank fusion.
+
+Dense retrieval blurs exact strings such as product names, error codes and
+version numbers; a keyword index finds them directly and answers without a model
+call. Postings are kept per term as packed arrays of document numbers (uint32) and
+term frequencies (uint16), so appending a chunk is cheap and scoring a term is one
+vectorised NumPy pass. Deleted chunks are tombstoned and squeezed out on `save`.
+"""
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# words, and codes/numbers joined by - . / _ : (e.g. "E-1042", "v2.3.1", "ISO/IEC")
+_TOKEN = re.compile(r"[^\W_]+(?:[-./_:][^\W_]+)*")
+_SPLIT = re.compile(r"[-./_:]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound tokens are also indexed by their parts."""
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if len(token) > 1 and _SPLIT.search(token):
+            tokens.extend(part for part in _SPLIT.split(token) if part)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score = sum of 1 / (k + rank) over the lists an id appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: -kv[1])
+
+
+class BM25Index:
+    """Okapi BM25 over chunk ids, persisted to a single .npz file at `path`."""
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.clear()
+        if path and os.path.exists(path):
+            self._load()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids: List[Optional[str]] = []  # document number -> chunk id, None once deleted
+            self._docs: Dict[str, int] = {}
+            self._lengths = array("I")  # 0 marks a deleted document
+            self._postings: Dict[str, Tuple[array, array]] = {}
+            self._total_length = 0
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        """Index chunks; an id that is already indexed is replaced."""
+        with self._lock:
+            self.remove([cid for cid in ids if cid in self._docs])
+            for cid, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                doc = len(self._ids)
+                self._ids.append(cid)
+                self._docs[cid] = doc
+                length = max(1, sum(counts.values()))
+                self._lengths.append(length)
+                self._total_length += length
+                for term, tf in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("H"))
+                    postings[0].append(doc)
+                    postings[1].append(min(tf, 65535))
+            self._dirty = True
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for cid in ids:
+                doc = self._docs.pop(cid, None)
+                if doc is None:
+                    continue
+                self._total_length -= self._lengths[doc]
+                self._lengths[doc] = 0
+                self._ids[doc] = None
+                self._dirty = True
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top `k` (chunk id, BM25 score) pairs, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            n_docs = len(self._docs)
+            if not terms or not n_docs or k <= 0:
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            avg_length = self._total_length / n_docs
+            scores = np.zeros(len(lengths), dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                doc_lengths = lengths[docs]
+                live = doc_lengths > 0
+                df = int(live.sum())
+                if not df:
+                    continue
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                tf = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                norm = self.k1 * (1.0 - self.b + self.b * doc_lengths / avg_length)
+                # a document appears once per term, so plain fancy-index addition is safe
+                scores[docs] += np.where(live, idf * tf * (self.k1 + 1.0) / (tf + norm), 0.0)
+            hits = np.flatnonzero(scores)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            hits = hits[np.argsort(-scores[hits])]
+            return [(self._ids[doc], float(scores[doc])) for doc in hits]
+
+    def _compact(self) -> None:
+        # Renumber live documents and drop tombstoned postings
+        remap = np.full(len(self._ids), -1, dtype=np.int64)
+        live = [doc for doc, cid in enumerate(self._ids) if cid is not None]
+        remap[live] = np.arange(len(live))
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            docs_np = np.frombuffer(docs, dtype=np.uint32)
+            keep = lengths[docs_np] > 0
+            if keep.any():
+                postings[term] = (array("I", remap[docs_np[keep]].astype(np.uint32).tobytes()),
+                                  array("H", np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes()))
+        new_lengths = array("I", lengths[live].tobytes())
+        self._ids = [self._ids[doc] for doc in live]
+        self._docs = {cid: doc for doc, cid in enumerate(self._ids)}
+        self._lengths = new_lengths
+        self._postings = postings
+
+    def save(self) -> None:
+        """Write the index atomically to `path` (compacting deletions first)."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            if len(self._ids) > len(self._docs):
+                self._compact()
+            terms = sorted(self._postings)
+            sizes = np.array([len(self._postings[t][0]) for t in terms], dtype=np.int64)
+            offsets = np.concatenate([[0], np.cumsum(sizes)]) if terms else np.zeros(1, dtype=np.int64)
+            docs = b"".join(self._postings[t][0].tobytes() for t in terms)
+            tfs = b"".join(self._postings[t][1].tobytes() for t in terms)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, terms=np.array("\n".join(terms)), ids=np.array("\n".join(self._ids)),
+                         lengths=np.frombuffer(self._lengths, dtype=np.uint32), offsets=offsets,
+                         docs=np.frombuffer(docs, dtype=np.uint32), tfs=np.frombuffer(tfs, dtype=np.uint16))
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    def _load(self) -> None:
+        with np.load(self.path) as data:
+            terms = str(data["terms"]).split("\n") if str(data["terms"]) else []
+            ids = str(data["ids"]).split("\n") if str(data["ids"]) else []
+            offsets, docs, tfs = data["offsets"], data["docs"], data["tfs"]
+            self._lengths = array("I", data["lengths"].astype(np.uint32).tobytes())
+        self._ids = list(ids)
+        self._docs = {cid: doc for doc, cid in enumerate(ids)}
+        self._total_length = int(np.frombuffer(self._lengths, dtype=np.uint32).sum())
+        self._postings = {
+            term: (array("I", docs[offsets[i]:offsets[i + 1]].tobytes()),
+                   array("H", tfs[offsets[i]:offsets[i + 1]].tobytes()))
+            for i, term in enumerate(terms)
+        }
+        self._dirty = False
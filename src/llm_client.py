@@ -0,0 +1,190 @@
+"""Shared OpenAI chat client with rate limiting, retries and usage accounting.
+
+One `LLMClient` per API key is reused for the whole process, so HTTP connections
+are pooled. Calls wait for a request and a token budget (token buckets sized to the
+org's per-minute limits) and for a free in-flight slot. Rate-limit, timeout,
+connection and 5xx errors are retried with jittered exponential backoff. So a burst
+of questions queues up instead of failing on the first 429.
+"""
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+import openai
+from openai import OpenAI
+
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+_RETRYABLE = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+              openai.InternalServerError)
+# Completion budget assumed when the call sets no max_tokens
+_DEFAULT_COMPLETION_TOKENS = 512
+
+
+class TokenBucket:
+    """Refills at `rate` units per second up to `capacity`; `acquire` blocks until enough is available."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Take `amount` units, waiting if needed; returns the seconds spent waiting."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return waited
+                delay = (amount - self._level) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """Charge (positive) or refund (negative) units after the fact, e.g. actual vs estimated tokens."""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - amount)
+
+
+def _estimate_tokens(messages: List[Dict], kwargs: Dict) -> int:
+    # ~4 characters per token is close enough to budget against a per-minute limit
+    prompt = sum(len(str(m.get("content") or "")) for m in messages) // 4 + 4 * len(messages)
+    completion = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or _DEFAULT_COMPLETION_TOKENS
+    return prompt + completion
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except Exception:
+        return None
+
+
+class LLMClient:
+    """Rate-limited, retrying wrapper around one pooled `OpenAI` client."""
+
+    def __init__(self, api_key: Optional[str] = None, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = LLM_TOKENS_PER_MINUTE, max_in_flight: int = LLM_MAX_IN_FLIGHT,
+                 max_retries: int = LLM_MAX_RETRIES, base_delay: float = 0.5, max_delay: float = 30.0,
+                 timeout: float = LLM_TIMEOUT_SECONDS):
+        # Retries are done here so that they also wait on the rate limiter
+        self.client = OpenAI(api_key=api_key, max_retries=0, timeout=timeout)
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 60.0 * 5))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter keeps clients that were throttled together from retrying in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, _retry_after(error) or 0.0)
+
+    def _record(self, model: str, **values: float) -> None:
+        with self._lock:
+            usage = self._usage[model]
+            for key, value in values.items():
+                usage[key] += value
+
+    def _call(self, model: str, messages: List[Dict], kwargs: Dict):
+        estimate = _estimate_tokens(messages, kwargs)
+        for attempt in range(self.max_retries + 1):
+            queued = self.requests.acquire() + self.tokens.acquire(estimate)
+            started = time.perf_counter()
+            try:
+                resp = self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+            except _RETRYABLE as e:
+                self._record(model, errors=1, queued_seconds=queued)
+                if attempt == self.max_retries:
+                    raise
+                self._record(model, retries=1)
+                time.sleep(self._backoff(attempt, e))
+                continue
+            except Exception:
+                self._record(model, errors=1, queued_seconds=queued)
+                raise
+            self._record(model, calls=1, queued_seconds=queued,
+                         latency_seconds=time.perf_counter() - started)
+            return resp, estimate
+
+    def create(self, model: str, messages: List[Dict], **kwargs):
+        """`chat.completions.create` with rate limiting, retries and usage accounting."""
+        with self._slots:
+            resp, estimate = self._call(model, messages, kwargs)
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+            self.tokens.adjust(prompt + completion - estimate)
+            self._record(model, prompt_tokens=prompt, completion_tokens=completion)
+        return resp
+
+    def stream(self, model: str, messages: List[Dict], **kwargs) -> Iterator:
+        """Streaming `create`; yields chunks and holds its in-flight slot until the stream ends.
+
+        Only opening the stream is retried; an error mid-stream propagates to the caller.
+        """
+        with self._slots:
+            stream, _ = self._call(model, messages, {**kwargs, "stream": True})
+            for chunk in stream:
+                yield chunk
+
+    def usage(self) -> Dict[str, Dict[str, float]]:
+        """Per-model totals: calls, retries, errors, tokens, latency and queueing seconds."""
+        with self._lock:
+            return {model: dict(usage) for model, usage in self._usage.items()}
+
+
+def _with_means(usage: Dict[str, float]) -> Dict[str, float]:
+    attempts = usage.get("calls", 0) + usage.get("errors", 0)
+    usage["mean_latency_seconds"] = usage.get("latency_seconds", 0) / usage["calls"] if usage.get("calls") else 0.0
+    usage["mean_queued_seconds"] = usage.get("queued_seconds", 0) / attempts if attempts else 0.0
+    return usage
+
+
+_CLIENTS: Dict[Optional[str], LLMClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_llm_client(api_key: Optional[str] = None) -> LLMClient:
+    """Return the process-wide client for `api_key` (default: OPENAI_API_KEY), creating it once."""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY environment variable is not set")
+    with _CLIENTS_LOCK:
+        if api_key not in _CLIENTS:
+            _CLIENTS[api_key] = LLMClient(api_key)
+        return _CLIENTS[api_key]
+
+
+def llm_usage_stats() -> Dict[str, Dict[str, float]]:
+    """Usage of all shared clients merged per model, with mean latency and queueing time."""
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+    merged: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for client in clients:
+        for model, usage in client.usage().items():
+            for key, value in usage.items():
+                merged[model][key] += value
+    return {model: _with_means(dict(usage)) for model, usage in merged.items()}
@@ -0,0 +1,92 @@
+"""Parallel, streaming PDF text extraction.
+
+Kept separate from ai_helpers so pool workers (started with "spawn") only have to
+import pypdf, not the embedding and vector-store stacks.
+"""
+import multiprocessing
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from pypdf import PdfReader
+
+
+class PdfPage(NamedTuple):
+    path: str
+    page_no: int
+    text: str
+    start: int  # character offset of this page in the file text ("\n".join of its pages)
+
+
+# Per-process reader cache so a worker parses each file's structure once
+_READERS: "OrderedDict[Tuple[str, int, int], PdfReader]" = OrderedDict()
+_MAX_OPEN_READERS = 4
+
+
+def _get_reader(path: str) -> PdfReader:
+    # Keyed by mtime and size too, so a re-uploaded file at the same path is re-read
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    reader = _READERS.get(key)
+    if reader is None:
+        reader = _READERS[key] = PdfReader(path)
+        while len(_READERS) > _MAX_OPEN_READERS:
+            _READERS.popitem(last=False)
+    return reader
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of one PDF."""
+    reader = _get_reader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages(
+    pdf_paths: Iterable[str],
+    max_workers: Optional[int] = None,
+    pages_per_task: int = 8,
+    max_in_flight: Optional[int] = None,
+) -> Iterator[PdfPage]:
+    """Yield a PdfPage per page of each PDF, in file and page order.
+
+    Page ranges are extracted across a process pool; each page is yielded as soon as
+    it and the pages before it are done. At most `max_in_flight` ranges are queued, so
+    memory stays bounded however large the files are. `max_workers=0` extracts in
+    this process; `None` uses one worker per CPU but stays in-process for small inputs.
+    """
+    tasks: List[Tuple[str, int, int]] = []
+    for path in pdf_paths:
+        n_pages = len(_get_reader(path).pages)
+        tasks.extend((path, start, min(start + pages_per_task, n_pages)) for start in range(0, n_pages, pages_per_task))
+
+    offsets = {}
+
+    def emit(task: Tuple[str, int, int], texts: List[str]) -> Iterator[PdfPage]:
+        path, start, _ = task
+        for page_no, text in enumerate(texts, start=start):
+            offset = offsets.get(path, 0)
+            offsets[path] = offset + len(text) + 1
+            yield PdfPage(path, page_no, text, offset)
+
+    if max_workers is None:
+        max_workers = 0 if len(tasks) <= 2 else (os.cpu_count() or 1)
+    if max_workers == 0:
+        for task in tasks:
+            yield from emit(task, extract_page_range(*task))
+        return
+
+    max_in_flight = max_in_flight or 2 * max_workers
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, pool.submit(extract_page_range, *task)))
+            if len(pending) >= max_in_flight:
+                task_done, future = pending.popleft()
+                yield from emit(task_done, future.result())
+        while pending:
+            task_done, future = pending.popleft()
+            yield from emit(task_done, future.result())
+    finally:
+        # Also runs when the consumer stops early; don't wait for queued ranges
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,78 @@
+"""Second-stage reranking of retrieved chunks with a cross-encoder.
+
+A cross-encoder reads the query and a chunk together, so it judges relevance much
+better than embedding distance; it is also much slower, so it only sees a retrieved
+candidate set. Scores are cached per (query, chunk id), so repeated and refined
+questions skip the model. Candidates are scored in retrieval order, in batches, until
+`budget_seconds` runs out. Whatever was not scored by then keeps its retrieval order
+behind the scored ones.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# [(query, passage), ...] -> relevance scores, higher is better
+ScoreFn = Callable[[List[Tuple[str, str]]], np.ndarray]
+
+
+class Reranked(NamedTuple):
+    order: List[int]  # indices into the candidates, best first, cut to top_k
+    scores: List[Optional[float]]  # cross-encoder score per entry of `order`; None if not scored in time
+    scored: int
+    cached: int
+    skipped: int
+
+
+class Reranker:
+    def __init__(self, score_fn: ScoreFn, batch_size: int = 32, cache_size: int = 50000):
+        self.score_fn = score_fn
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"scored": 0, "cached": 0, "skipped": 0, "calls": 0}
+
+    def rerank(self, query: str, ids: Sequence[str], documents: Sequence[str], top_k: int,
+               budget_seconds: Optional[float] = None) -> Reranked:
+        """Order candidates (given in retrieval order) by cross-encoder score."""
+        deadline = time.perf_counter() + budget_seconds if budget_seconds is not None else None
+        key_query = " ".join(query.split()).casefold()
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for i, cid in enumerate(ids):
+                score = self._cache.get((key_query, cid))
+                if score is not None:
+                    self._cache.move_to_end((key_query, cid))
+                    scores[i] = score
+        cached = len(scores)
+        pending = [i for i in range(len(ids)) if i not in scores]
+        scored = 0
+        for start in range(0, len(pending), self.batch_size):
+            # always score the first batch, so a tiny budget still reranks the head
+            if start and deadline is not None and time.perf_counter() >= deadline:
+                break
+            batch = pending[start:start + self.batch_size]
+            values = np.asarray(self.score_fn([(query, documents[i]) for i in batch]), dtype=np.float32).ravel()
+            with self._lock:
+                for i, value in zip(batch, values):
+                    scores[i] = float(value)
+                    self._cache[(key_query, ids[i])] = float(value)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            scored += len(batch)
+        ranked = sorted(scores, key=lambda i: -scores[i])
+        unscored = [i for i in range(len(ids)) if i not in scores]
+        order = (ranked + unscored)[:top_k]
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["scored"] += scored
+            self._stats["cached"] += cached
+            self._stats["skipped"] += len(unscored)
+        return Reranked(order, [scores.get(i) for i in order], scored, cached, len(unscored))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "cache_entries": len(self._cache)}
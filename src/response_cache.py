@@ -0,0 +1,117 @@
+"""SQLite-backed cache of LLM answers with optional near-duplicate question matching."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+EmbedFn = Callable[[List[str]], np.ndarray]
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """Answers keyed by sha256(model, system prompt, context, question).
+
+    Exact hits need all four to match. With `embed_fn` set, a miss falls back to
+    the most similar cached question asked against the same model, system prompt and
+    context, if its cosine similarity is at least `similarity_threshold`. Entries
+    expire after `ttl_seconds` and the least recently used are evicted beyond
+    `max_entries`.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400.0, max_entries: int = 10000,
+                 embed_fn: Optional[EmbedFn] = None, similarity_threshold: float = 0.95):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, scope TEXT NOT NULL, question TEXT NOT NULL, embedding BLOB, "
+            "answer TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn([question])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, model: str, system: str, context: str, question: str) -> Optional[str]:
+        scope = _digest(model, system, context)
+        key = _digest(scope, question)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT answer FROM responses WHERE key = ? AND created >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row:
+                self._touch(key, now)
+                self._stats["exact_hits"] += 1
+                return row[0]
+            rows = []
+            if self.embed_fn is not None:
+                rows = self.conn.execute(
+                    "SELECT key, embedding, answer FROM responses "
+                    "WHERE scope = ? AND created >= ? AND embedding IS NOT NULL",
+                    (scope, now - self.ttl),
+                ).fetchall()
+        if rows:
+            # embed outside the lock; the model call is the slow part
+            matrix = np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+            scores = matrix @ self._embed(question)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                with self._lock:
+                    self._touch(rows[best][0], now)
+                    self._stats["semantic_hits"] += 1
+                return rows[best][2]
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _touch(self, key: str, now: float) -> None:
+        self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+
+    def put(self, model: str, system: str, context: str, question: str, answer: str) -> None:
+        scope = _digest(model, system, context)
+        key = _digest(scope, question)
+        embedding = self._embed(question).tobytes() if self.embed_fn is not None else None
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, question, embedding, answer, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, scope, question, embedding, answer, now, now),
+            )
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
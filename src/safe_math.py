@@ -0,0 +1,160 @@
+"""Sandboxed arithmetic for agent tools.
+
+Expressions are parsed with `ast` and only numeric literals, whitelisted
+operators, named variables and a few math functions are allowed. Anything that
+could run unbounded is refused before it runs: large exponents, integers past
+`max_int_bits`, and trees with too many nodes. There is also a wall-clock budget.
+Variables given as lists are evaluated element-wise with NumPy, so one call can
+compute e.g. the growth for every year of a series.
+"""
+import ast
+import math
+import operator
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+Number = Union[int, float]
+
+_BINARY: Dict[type, Callable] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY: Dict[type, Callable] = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+# NumPy versions work for scalars and arrays alike
+_FUNCTIONS: Dict[str, Callable] = {
+    "abs": np.abs,
+    "round": np.round,
+    "sqrt": np.sqrt,
+    "log": np.log,
+    "log10": np.log10,
+    "exp": np.exp,
+    "min": np.minimum,
+    "max": np.maximum,
+}
+# (min, max) number of arguments
+_ARITY: Dict[str, Tuple[int, int]] = {name: (1, 1) for name in _FUNCTIONS}
+_ARITY.update({"round": (1, 2), "min": (2, 2), "max": (2, 2)})
+# float64 has no digits beyond 10**308, and larger ndigits make np.round run for seconds
+_MAX_ROUND_DIGITS = 308
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+
+
+class ExpressionLimitError(ArithmeticError):
+    """The expression would exceed a size, exponent or time limit."""
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str, max_nodes: int = 200) -> ast.Expression:
+    """Parse and whitelist-check `expression`; raises ValueError for anything not allowed."""
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Not an arithmetic expression: {e.msg}") from None
+    nodes = 0
+    for node in ast.walk(tree):
+        nodes += 1
+        if nodes > max_nodes:
+            raise ExpressionLimitError(f"Expression has more than {max_nodes} nodes")
+        if isinstance(node, (ast.Expression, ast.Load)) or type(node) in _BINARY or type(node) in _UNARY:
+            continue
+        if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+            if type(node.op) not in _BINARY and type(node.op) not in _UNARY:
+                raise ValueError(f"Operator {type(node.op).__name__} is not allowed")
+        elif isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ValueError(f"Only numbers are allowed, not {node.value!r}")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+                raise ValueError(f"Only these functions are allowed: {', '.join(_FUNCTIONS)}")
+            low, high = _ARITY[node.func.id]
+            if not low <= len(node.args) <= high:
+                expected = low if low == high else f"{low} or {high}"
+                raise ValueError(f"{node.func.id}() takes {expected} argument(s), got {len(node.args)}")
+        elif not isinstance(node, ast.Name):
+            raise ValueError(f"{type(node).__name__} is not allowed in an arithmetic expression")
+    return tree
+
+
+class _Evaluator:
+    def __init__(self, variables: Dict, max_int_bits: int, max_exponent: float, deadline: float):
+        self.variables = variables
+        self.max_int_bits = max_int_bits
+        self.max_exponent = max_exponent
+        self.deadline = deadline
+
+    def eval(self, node):
+        if time.perf_counter() > self.deadline:
+            raise ExpressionLimitError("Expression exceeded its time budget")
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id in self.variables:
+                return self.variables[node.id]
+            if node.id in _CONSTANTS:
+                return _CONSTANTS[node.id]
+            raise ValueError(f"Unknown name {node.id!r}")
+        if isinstance(node, ast.UnaryOp):
+            return _UNARY[type(node.op)](self.eval(node.operand))
+        if isinstance(node, ast.Call):
+            args = [self.eval(arg) for arg in node.args]
+            if node.func.id == "round" and len(args) == 2:
+                args[1] = self._ndigits(args[1])
+            return _FUNCTIONS[node.func.id](*args)
+        left, right = self.eval(node.left), self.eval(node.right)
+        op = type(node.op)
+        self._check(op, left, right)
+        result = _BINARY[op](left, right)
+        if isinstance(result, int) and result.bit_length() > self.max_int_bits:
+            raise ExpressionLimitError(f"Integer result exceeds {self.max_int_bits} bits")
+        return result
+
+    @staticmethod
+    def _ndigits(value) -> int:
+        if isinstance(value, np.ndarray) or not math.isfinite(value) or value != int(value):
+            raise ValueError("round() digits must be a single whole number")
+        if abs(value) > _MAX_ROUND_DIGITS:
+            raise ExpressionLimitError(f"round() digits must be between -{_MAX_ROUND_DIGITS} and {_MAX_ROUND_DIGITS}")
+        return int(value)
+
+    def _check(self, op: type, left, right) -> None:
+        # Refuse operations whose result would be huge before computing it
+        if op is ast.Pow:
+            exponent = np.max(np.abs(right)) if isinstance(right, np.ndarray) else abs(right)
+            if exponent > self.max_exponent:
+                raise ExpressionLimitError(f"Exponent {exponent} exceeds {self.max_exponent}")
+            if isinstance(left, int) and isinstance(right, int) and right > 0 \
+                    and max(left.bit_length(), 1) * right > self.max_int_bits:
+                raise ExpressionLimitError(f"Integer result exceeds {self.max_int_bits} bits")
+        elif op is ast.Mult and isinstance(left, int) and isinstance(right, int):
+            if left.bit_length() + right.bit_length() > self.max_int_bits + 1:
+                raise ExpressionLimitError(f"Integer result exceeds {self.max_int_bits} bits")
+
+
+def evaluate(expression: str, variables: Optional[Dict[str, Union[Number, Sequence[Number]]]] = None,
+             max_int_bits: int = 4096, max_exponent: float = 1000, time_budget: float = 0.1):
+    """Evaluate an arithmetic expression; returns a number, or an array if any variable is a list.
+
+    List variables are broadcast element-wise (they must have compatible lengths).
+    Raises ValueError for disallowed syntax and ExpressionLimitError when a limit is hit.
+    """
+    tree = compile_expression(expression)
+    values = {}
+    for name, value in (variables or {}).items():
+        if isinstance(value, bool) or not isinstance(value, (int, float, list, tuple, np.ndarray)):
+            raise ValueError(f"Variable {name!r} must be a number or a list of numbers")
+        values[name] = np.asarray(value, dtype=np.float64) if isinstance(value, (list, tuple, np.ndarray)) else value
+    evaluator = _Evaluator(values, max_int_bits, max_exponent, time.perf_counter() + time_budget)
+    # element-wise division by zero gives inf/nan for that element instead of failing the batch
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        result = evaluator.eval(tree.body)
+    if isinstance(result, np.generic):
+        result = result.item()
+    return result
@@ -0,0 +1,80 @@
+"""Brute-force cosine similarity search over an in-memory embedding matrix."""
+from typing import Tuple
+import numpy as np
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SimilarityIndex:
+    """Corpus embeddings normalised once into one contiguous matrix.
+
+    `search` scores a whole batch of queries with a matrix product and selects the
+    top k with `argpartition`, so there is no per-query norm computation or full sort.
+    With `dtype=np.float16` the matrix takes half the memory; blocks are upcast to
+    float32 for the product. Scoring runs over `block_rows` corpus rows at a time to
+    bound the temporary score matrix for very large corpora.
+    """
+
+    def __init__(self, embeddings=None, dtype=np.float32, block_rows: int = 262144):
+        self.dtype = np.dtype(dtype)
+        self.block_rows = block_rows
+        self._matrix = None
+        self._size = 0
+        if embeddings is not None:
+            self.add(embeddings)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=self.dtype)
+        return self._matrix[:self._size]
+
+    def add(self, embeddings) -> None:
+        """Append embeddings; capacity grows geometrically so repeated adds stay cheap."""
+        rows = normalize_rows(embeddings).astype(self.dtype)
+        if self._matrix is None:
+            self._matrix = np.empty((max(len(rows), 1), rows.shape[1]), dtype=self.dtype)
+        needed = self._size + len(rows)
+        if needed > len(self._matrix):
+            grown = np.empty((max(needed, 2 * len(self._matrix)), self._matrix.shape[1]), dtype=self.dtype)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size:needed] = rows
+        self._size = needed
+
+    def search(self, queries, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, indices), each (n_queries, k), best match first."""
+        q = normalize_rows(queries)
+        k = min(k, self._size)
+        if k == 0:
+            return np.empty((len(q), 0), dtype=np.float32), np.empty((len(q), 0), dtype=np.int64)
+        best_scores, best_idx = None, None
+        for start in range(0, self._size, self.block_rows):
+            block = self._matrix[start:min(start + self.block_rows, self._size)]
+            scores = q @ block.T if self.dtype == np.float32 else q @ block.astype(np.float32).T
+            kb = min(k, scores.shape[1])
+            idx = np.argpartition(-scores, kb - 1, axis=1)[:, :kb]
+            top = np.take_along_axis(scores, idx, axis=1)
+            if best_scores is None:
+                best_scores, best_idx = top, idx + start
+            else:
+                # merge this block's candidates with the running top k
+                cand_scores = np.concatenate([best_scores, top], axis=1)
+                cand_idx = np.concatenate([best_idx, idx + start], axis=1)
+                # fewer than k candidates while the first blocks are smaller than k
+                kk = min(k, cand_scores.shape[1])
+                keep = np.argpartition(-cand_scores, kk - 1, axis=1)[:, :kk]
+                best_scores = np.take_along_axis(cand_scores, keep, axis=1)
+                best_idx = np.take_along_axis(cand_idx, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_idx, order, axis=1)
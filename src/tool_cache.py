@@ -0,0 +1,72 @@
+"""Cache of agent tool results keyed by tool name and normalised argument.
+
+ReAct loops often repeat an action verbatim, or with different case or spacing,
+and every repeat used to re-run the tool. Each tool has a policy: whether its results
+may be cached at all (a clock or a mutable store must not be), and for how long.
+Only successful observations are cached.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+
+class ToolPolicy(NamedTuple):
+    cacheable: bool = True
+    ttl_seconds: float = 600.0
+    # maps the raw argument to the cache key; default collapses whitespace and case
+    normalize: Optional[Callable[[str], str]] = None
+
+
+def normalize_arg(arg: str) -> str:
+    return " ".join(arg.split()).casefold()
+
+
+class ToolCache:
+    """LRU of observations, at most `max_entries`, expiring per the tool's policy."""
+
+    def __init__(self, policies: Optional[Dict[str, ToolPolicy]] = None, default: ToolPolicy = ToolPolicy(),
+                 max_entries: int = 1024):
+        self.policies = policies or {}
+        self.default = default
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "uncacheable": 0}
+
+    def policy(self, tool: str) -> ToolPolicy:
+        return self.policies.get(tool, self.default)
+
+    def key(self, tool: str, arg: str) -> Tuple[str, str]:
+        normalize = self.policy(tool).normalize or normalize_arg
+        return tool, normalize(arg)
+
+    def get(self, tool: str, arg: str) -> Optional[str]:
+        policy = self.policy(tool)
+        with self._lock:
+            if not policy.cacheable:
+                self._stats["uncacheable"] += 1
+                return None
+            key = self.key(tool, arg)
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > policy.ttl_seconds:
+                self._entries.pop(key, None)
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, tool: str, arg: str, observation: str) -> None:
+        if not self.policy(tool).cacheable:
+            return
+        with self._lock:
+            key = self.key(tool, arg)
+            self._entries[key] = (time.monotonic(), observation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
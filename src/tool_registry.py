@@ -0,0 +1,140 @@
+"""Agent tools with JSON-schema parameters, for native function calling.
+
+A `ToolRegistry` replaces a bare name -> function dict. Each tool declares typed
+parameters, so the registry can hand the model OpenAI `tools` definitions, validate
+the arguments the model sends, and map a plain `Tool[arg]` text call to the tool's
+single parameter.
+"""
+import inspect
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+_JSON_TYPES = {
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+
+class ToolSpec(NamedTuple):
+    name: str
+    fn: Callable
+    description: str
+    parameters: Dict  # JSON schema of an object
+
+    @property
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(self.fn)
+
+    def definition(self) -> Dict:
+        return {"type": "function",
+                "function": {"name": self.name, "description": self.description, "parameters": self.parameters}}
+
+    def validate(self, args: Any) -> Optional[str]:
+        """Return a description of what is wrong with `args`, or None if they fit the schema."""
+        if not isinstance(args, dict):
+            return f"arguments for {self.name} must be a JSON object"
+        properties = self.parameters.get("properties", {})
+        missing = [p for p in self.parameters.get("required", []) if p not in args]
+        if missing:
+            return f"{self.name} is missing required argument(s): {', '.join(missing)}"
+        for key, value in args.items():
+            if key not in properties:
+                return f"{self.name} has no argument {key!r}; expected {', '.join(properties) or 'none'}"
+            expected = properties[key].get("type")
+            # bool is an int subclass, but true is not a number in JSON schema terms
+            if expected in _JSON_TYPES and (not isinstance(value, _JSON_TYPES[expected])
+                                            or (isinstance(value, bool) and expected != "boolean")):
+                return f"argument {key!r} of {self.name} must be of type {expected}"
+        return None
+
+    def text_parameter(self) -> Optional[str]:
+        """The parameter a bare `Tool[arg]` fills: the only one, or else the only required one."""
+        properties = self.parameters.get("properties", {})
+        if len(properties) == 1:
+            return next(iter(properties))
+        required = self.parameters.get("required", [])
+        return required[0] if len(required) == 1 else None
+
+    def text_args(self, arg: str) -> Any:
+        """Arguments for a `Tool[arg]` text call: a JSON object, or the value of `text_parameter`.
+
+        >>> calc = ToolSpec("Calculate", eval, "simple math", {
+        ...     "properties": {"expression": {"type": "string"}, "values": {"type": "object"}},
+        ...     "required": ["expression"]})
+        >>> calc.text_args("2**10")
+        {'expression': '2**10'}
+        >>> calc.text_args('{"expression": "a + 1", "values": {"a": [1, 2]}}')
+        {'expression': 'a + 1', 'values': {'a': [1, 2]}}
+        >>> ToolSpec("Sqrt", eval, "", {"properties": {"x": {"type": "number"}}}).text_args("2.5")
+        {'x': 2.5}
+        """
+        key = self.text_parameter()
+        if key is None or len(self.parameters.get("properties", {})) > 1:
+            try:
+                parsed = json.loads(arg)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, dict) or key is None:
+                return arg if parsed is None else parsed
+        if self.parameters["properties"][key].get("type") in ("number", "integer"):
+            try:
+                return {key: json.loads(arg)}
+            except ValueError:
+                pass
+        return {key: arg}
+
+    def format_args(self, args: Dict) -> str:
+        """Compact display form; single-parameter tools show just the value."""
+        if len(args) == 1:
+            return str(next(iter(args.values())))
+        return json.dumps(args, sort_keys=True)
+
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools: Dict[str, ToolSpec] = {}
+
+    def register(self, name: str, description: str, properties: Dict[str, Dict],
+                 required: Optional[List[str]] = None) -> Callable[[Callable], Callable]:
+        """Decorator adding a tool whose keyword arguments are described by `properties`."""
+        def decorator(fn: Callable) -> Callable:
+            self.add(ToolSpec(name, fn, description, {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties) if required is None else required,
+            }))
+            return fn
+        return decorator
+
+    def add(self, spec: ToolSpec) -> None:
+        self._tools[spec.name] = spec
+
+    @classmethod
+    def from_callables(cls, tools: Dict[str, Callable[[str], Any]],
+                       descriptions: Optional[Dict[str, str]] = None) -> "ToolRegistry":
+        """Registry for plain tools that take one string argument."""
+        registry = cls()
+        for name, fn in tools.items():
+            param = next(iter(inspect.signature(fn).parameters))
+            registry.register(name, (descriptions or {}).get(name, name), {param: {"type": "string"}})(fn)
+        return registry
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._tools.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def __iter__(self):
+        return iter(self._tools.values())
+
+    def definitions(self) -> List[Dict]:
+        """Tool definitions for the `tools` argument of a chat completion."""
+        return [spec.definition() for spec in self._tools.values()]
+
+    def describe(self) -> str:
+        return ", ".join(f"{spec.name} ({spec.description})" for spec in self._tools.values())
@@ -0,0 +1,530 @@
+"""Vector-store backends that can stand in for a Chroma collection.
+
+ai_helpers talks to collections through a small subset of the Chroma collection API
+(`upsert`, `delete`, `query`, `get`, `count`). The `VectorCollection` protocol types that
+subset; Chroma collections satisfy it as-is and `FaissCollection` implements it on
+top of a FAISS index with a SQLite sidecar for ids, documents and metadata.
+
+FAISS collections can keep their vectors quantized (float16, int8 or product
+quantization), which shrinks the in-RAM index 2x, 4x or ~32x. The float32 vectors
+then live in a memory-mapped sidecar file and only the top candidates of each
+search are read back from it and rescored at full precision.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Protocol, Sequence
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # optional: only needed for VECTOR_BACKEND=faiss
+    faiss = None
+
+_SQLITE_MAX_PARAMS = 500
+QUANTIZATIONS = ("none", "fp16", "int8", "pq")
+# FAISS wants ~39 training points per k-means centroid
+_POINTS_PER_CENTROID = 39
+# IVF starts with at least this many lists; smaller corpora are searched exactly
+_MIN_IVF_LISTS = 64
+# rebuild an IVF index once the corpus supports this many times its current lists
+_IVF_REGROWTH = 4
+# int8 learns per-dimension ranges; too few vectors give ranges later data falls outside
+_SQ8_TRAINING_SIZE = 1000
+# k-means subsamples to 256 points per centroid anyway
+_MAX_TRAINING_POINTS = 256 * 1024
+_REBUILD_BATCH = 65536
+# candidates rescored per requested hit; PQ codes are coarse enough to need a wide net
+# (21_Quantization_Benchmark.py: recall@10 0.86 at 4x, 1.0 at 10x)
+DEFAULT_RESCORE = {"fp16": 4, "int8": 4, "pq": 10}
+
+
+class VectorCollection(Protocol):
+    """The collection methods ai_helpers relies on; results use Chroma's dict shapes.
+
+    Chroma collections match it structurally; other backends implement it.
+    """
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]) -> None: ...
+
+    def delete(self, ids: List[str]) -> None: ...
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict: ...
+
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("documents", "metadatas")) -> Dict: ...
+
+    def count(self) -> int: ...
+
+
+def matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """Evaluate a Chroma-style `where` filter: field equality, `$eq`/`$ne`/`$in`, `$and`/`$or`."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = metadata.get(key)
+            for op, operand in cond.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != cond:
+            return False
+    return True
+
+
+class _VectorFile:
+    """Full-precision float32 vectors stored by int id (row = id) and read through a memory map."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._map: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.path) // (4 * self.dim) if os.path.exists(self.path) else 0
+
+    def write(self, first_id: int, vectors: np.ndarray) -> None:
+        # ids are allocated as one contiguous range per upsert; rows of deleted ids are just never read
+        with open(self.path, "r+b" if os.path.exists(self.path) else "wb") as f:
+            f.seek(first_id * 4 * self.dim)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._map = None
+
+    def read(self, int_ids: np.ndarray) -> np.ndarray:
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return np.asarray(self._map[int_ids])
+
+
+class FaissCollection(VectorCollection):
+    """FAISS index ("flat", "ivf" or "hnsw") persisted as `<name>.faiss` plus a SQLite sidecar.
+
+    `metric` is "cosine" (vectors normalised, inner product), "ip" or "l2"; distances
+    are returned smaller-is-better like Chroma's. A saved index is memory-mapped on
+    load for a fast cold start and only read fully into RAM on the first write.
+    HNSW cannot remove vectors, so deletions there are tombstoned and filtered out.
+
+    The SQLite rows are committed on every write but the index only on `save`. On
+    open, rows whose vectors the saved index lacks are re-added from the float32
+    sidecar when there is one, and otherwise dropped and listed in `lost_ids` so the
+    caller can re-ingest them; vectors whose rows are gone are removed.
+
+    IVF needs training data: until the collection holds enough vectors for
+    `_MIN_IVF_LISTS` lists it is kept in an exact flat index, and it is rebuilt from
+    the stored vectors whenever the corpus grows enough for 4x as many lists (up
+    to `nlist`), so early small batches do not fix the index layout forever.
+
+    `quantization` stores the indexed vectors as "fp16", "int8" (per-dimension scalar
+    quantization) or "pq" (`pq_m` sub-vectors of 8 bits each; "flat" and "ivf" only).
+    Like IVF, "int8" and "pq" stay in an exact flat index until there is enough data
+    to train them (1000 and 39 * 256 vectors). The float32 vectors go to `<name>.f32`
+    and each search fetches `rescore` times as many candidates from the quantized
+    index (default: `DEFAULT_RESCORE`), then reranks them exactly. The quantization of an existing index is fixed
+    by the saved file.
+    """
+
+    def __init__(self, directory: str, name: str, index_type: str = "flat", metric: str = "cosine",
+                 nlist: int = 1024, hnsw_m: int = 32, nprobe: int = 16, quantization: str = "none",
+                 pq_m: int = 48, rescore: Optional[int] = None):
+        if faiss is None:
+            raise ImportError("faiss is not installed; `pip install faiss-cpu` to use the FAISS backend")
+        if index_type not in ("flat", "ivf", "hnsw"):
+            raise ValueError(f"Unknown FAISS index type: {index_type!r}")
+        if metric not in ("cosine", "ip", "l2"):
+            raise ValueError(f"Unknown FAISS metric: {metric!r}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+        if quantization == "pq" and index_type == "hnsw":
+            raise ValueError("Product quantization is supported for 'flat' and 'ivf' FAISS indexes only")
+        os.makedirs(directory, exist_ok=True)
+        self.name = name
+        self.index_type = index_type
+        self.metric = metric
+        self.nlist = nlist
+        self.hnsw_m = hnsw_m
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.rescore = DEFAULT_RESCORE.get(quantization, 1) if rescore is None else rescore
+        self.index_path = os.path.join(directory, f"{name}.faiss")
+        self.vectors_path = os.path.join(directory, f"{name}.f32")
+        self._vectors: Optional[_VectorFile] = None
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._mmapped = False
+        self._staged = False  # a flat index standing in until there is enough data to train
+        self.conn = sqlite3.connect(os.path.join(directory, f"{name}.sqlite3"), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "int_id INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT, "
+            "deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        # next_int_id (ids are never reused) and dim, committed with the rows they describe
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.commit()
+        self.index = None
+        self.lost_ids: List[str] = []  # chunks whose vectors were lost in a crash; see _reconcile
+        if os.path.exists(self.index_path):
+            self._load()
+        self._reconcile()
+
+    # -- index lifecycle --------------------------------------------------
+
+    def _load(self) -> None:
+        try:
+            self.index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            self._mmapped = True
+        except RuntimeError:
+            # not every index type supports mmap; fall back to a regular read
+            self.index = faiss.read_index(self.index_path)
+            self._mmapped = False
+        self._staged = (self._needs_training() and isinstance(self.index, faiss.IndexIDMap2)
+                        and isinstance(faiss.downcast_index(self.index.index), faiss.IndexFlat))
+        self._set_search_params()
+        if self.quantization != "none":
+            self._vectors = _VectorFile(self.vectors_path, self.index.d)
+
+    def _meta(self, key: str) -> Optional[int]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _index_ids(self) -> np.ndarray:
+        if self.index is None:
+            return np.zeros(0, dtype=np.int64)
+        if isinstance(self.index, faiss.IndexIDMap):
+            return faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        ivf = faiss.extract_index_ivf(self.index)
+        lists = ivf.invlists
+        ids = [faiss.rev_swig_ptr(lists.get_ids(i), lists.list_size(i)).copy()
+               for i in range(ivf.nlist) if lists.list_size(i)]
+        return np.concatenate(ids).astype(np.int64) if ids else np.zeros(0, dtype=np.int64)
+
+    def _reconcile(self) -> None:
+        """Bring the index in line with the SQLite rows after a crash between a write and `save`."""
+        live = np.fromiter((row[0] for row in self.conn.execute(
+            "SELECT int_id FROM chunks WHERE deleted = 0")), dtype=np.int64)
+        rows = np.fromiter((row[0] for row in self.conn.execute("SELECT int_id FROM chunks")), dtype=np.int64)
+        indexed = self._index_ids()
+        missing = np.setdiff1d(live, indexed)
+        stale = np.setdiff1d(indexed, rows)
+        if not len(missing) and not len(stale):
+            return
+        if self.index is not None:
+            self._writable()
+        if len(stale):
+            if self.index_type == "hnsw":
+                # unremovable: tombstone rows keep them out of results and counted in searches
+                self.conn.executemany(
+                    "INSERT INTO chunks (int_id, id, deleted) VALUES (?, ? || ':stale', 1)",
+                    [(int(i), str(int(i))) for i in stale])
+            else:
+                self.index.remove_ids(stale)
+        dim = self.index.d if self.index is not None else self._meta("dim")
+        sidecar = _VectorFile(self.vectors_path, dim) if self.quantization != "none" and dim else None
+        if len(missing) and sidecar is not None and missing.max() < len(sidecar):
+            vectors = sidecar.read(missing)
+            if self.index is None:
+                self._create(vectors)
+            self.index.add_with_ids(vectors, missing)
+        elif len(missing):
+            batch = [int(i) for i in missing]
+            for start in range(0, len(batch), _SQLITE_MAX_PARAMS):
+                part = batch[start:start + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(part))
+                self.lost_ids.extend(row[0] for row in self.conn.execute(
+                    f"SELECT id FROM chunks WHERE int_id IN ({placeholders})", part))
+                self.conn.execute(f"DELETE FROM chunks WHERE int_id IN ({placeholders})", part)
+        self.conn.commit()
+        self._dirty = True
+        self.save()
+
+    def _writable(self) -> None:
+        if self._mmapped:
+            self.index = faiss.read_index(self.index_path)
+            self._mmapped = False
+            self._set_search_params()
+
+    def _set_search_params(self) -> None:
+        if self.index_type == "ivf" and not self._staged:
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+
+    def _faiss_metric(self) -> int:
+        return faiss.METRIC_L2 if self.metric == "l2" else faiss.METRIC_INNER_PRODUCT
+
+    def _codec(self, vectors: np.ndarray) -> str:
+        if self.quantization == "fp16":
+            return "SQfp16"
+        if self.quantization == "int8":
+            return "SQ8"
+        if self.quantization == "pq":
+            if vectors.shape[1] % self.pq_m:
+                raise ValueError(f"pq_m={self.pq_m} does not divide the embedding dimension {vectors.shape[1]}")
+            return f"PQ{self.pq_m}"
+        return "Flat"
+
+    def _needs_training(self) -> bool:
+        return self.index_type == "ivf" or self.quantization in ("int8", "pq")
+
+    def _training_size(self) -> int:
+        """Live vectors needed before the index is trained."""
+        size = _POINTS_PER_CENTROID * min(self.nlist, _MIN_IVF_LISTS) if self.index_type == "ivf" else 0
+        if self.quantization == "int8":
+            size = max(size, _SQ8_TRAINING_SIZE)
+        elif self.quantization == "pq":
+            # 256 centroids per sub-quantizer
+            size = max(size, _POINTS_PER_CENTROID * 256)
+        return size
+
+    def _new_index(self, training: np.ndarray, total: int):
+        """An empty index of the configured type, trained on `training` for `total` vectors."""
+        codec = self._codec(training)
+        if self.index_type == "flat":
+            spec = f"IDMap2,{codec}"
+        elif self.index_type == "hnsw":
+            spec = f"IDMap2,HNSW{self.hnsw_m}" + ("" if codec == "Flat" else f"_{codec}")
+        else:
+            spec = f"IVF{self._ivf_lists(total)},{codec}"
+        index = faiss.index_factory(training.shape[1], spec, self._faiss_metric())
+        if not index.is_trained:
+            index.train(training)
+        if self.index_type == "ivf":
+            # a hashtable direct map allows both reconstruct-by-id and remove_ids
+            faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+
+    def _ivf_lists(self, total: int) -> int:
+        return max(1, min(self.nlist, total // _POINTS_PER_CENTROID))
+
+    def _create(self, vectors: np.ndarray) -> None:
+        dim = vectors.shape[1]
+        self._codec(vectors)  # reject a bad pq_m before anything is stored
+        if self._needs_training():
+            self.index = faiss.index_factory(dim, "IDMap2,Flat", self._faiss_metric())
+            self._staged = True
+        else:
+            self.index = self._new_index(vectors, len(vectors))
+        self._set_search_params()
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (dim,))
+        if self.quantization != "none":
+            self._vectors = _VectorFile(self.vectors_path, dim)
+
+    def _maybe_train(self) -> None:
+        """Train the staged index, or rebuild an IVF index the corpus has outgrown."""
+        total = self.count()
+        if self._staged:
+            if total < self._training_size():
+                return
+        elif self.index_type != "ivf" or \
+                self._ivf_lists(total) < faiss.extract_index_ivf(self.index).nlist * _IVF_REGROWTH:
+            return
+        int_ids = np.fromiter((row[0] for row in self.conn.execute(
+            "SELECT int_id FROM chunks WHERE deleted = 0 ORDER BY int_id")), dtype=np.int64)
+        sample = int_ids
+        if len(int_ids) > _MAX_TRAINING_POINTS:
+            sample = np.sort(np.random.default_rng(0).choice(int_ids, _MAX_TRAINING_POINTS, replace=False))
+        index = self._new_index(self._vectors_for(sample), total)
+        for start in range(0, len(int_ids), _REBUILD_BATCH):
+            batch = int_ids[start:start + _REBUILD_BATCH]
+            index.add_with_ids(self._vectors_for(batch), batch)
+        self.index = index
+        self._staged = False
+        self._set_search_params()
+        # tombstoned (HNSW) vectors were not carried over
+        self.conn.execute("DELETE FROM chunks WHERE deleted = 1")
+        self.conn.commit()
+        self._dirty = True
+
+    def save(self) -> None:
+        """Write the index to disk if it changed since the last save."""
+        with self._lock:
+            if self.index is not None and self._dirty:
+                tmp_path = self.index_path + ".tmp"
+                faiss.write_index(self.index, tmp_path)
+                os.replace(tmp_path, self.index_path)
+                self._dirty = False
+
+    # -- collection API ---------------------------------------------------
+
+    def _prepare(self, embeddings) -> np.ndarray:
+        # copy: normalize_L2 works in place and must not touch the caller's array
+        vectors = np.array(embeddings, dtype=np.float32, order="C")
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if self.metric == "cosine":
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]) -> None:
+        vectors = self._prepare(embeddings)
+        with self._lock:
+            self.delete(ids)
+            if self.index is None:
+                self._create(vectors)
+            self._writable()
+            cur = self.conn.execute("SELECT COALESCE(MAX(int_id), -1) FROM chunks")
+            first = max(cur.fetchone()[0] + 1, self._meta("next_int_id") or 0)
+            int_ids = np.arange(first, first + len(ids), dtype=np.int64)
+            self.index.add_with_ids(vectors, int_ids)
+            if self._vectors is not None:
+                self._vectors.write(first, vectors)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (int_id, id, document, metadata, deleted) VALUES (?, ?, ?, ?, 0)",
+                [(int(i), cid, doc, json.dumps(meta or {}))
+                 for i, cid, doc, meta in zip(int_ids, ids, documents, metadatas)],
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_int_id', ?)",
+                              (first + len(ids),))
+            self.conn.commit()
+            self._dirty = True
+            self._maybe_train()
+
+    def delete(self, ids: List[str]) -> None:
+        ids = list(ids)
+        with self._lock:
+            int_ids = []
+            for start in range(0, len(ids), _SQLITE_MAX_PARAMS):
+                batch = ids[start:start + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                int_ids.extend(row[0] for row in self.conn.execute(
+                    f"SELECT int_id FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", batch))
+            if not int_ids:
+                return
+            removed = False
+            if self.index is not None and self.index_type != "hnsw":
+                self._writable()
+                self.index.remove_ids(np.asarray(int_ids, dtype=np.int64))
+                removed = True
+            if removed:
+                self.conn.executemany("DELETE FROM chunks WHERE int_id = ?", [(i,) for i in int_ids])
+            else:
+                # rows stay as tombstones so the (unremovable) vectors map to nothing live
+                self.conn.executemany(
+                    "UPDATE chunks SET deleted = 1, id = id || ':deleted:' || int_id WHERE int_id = ?",
+                    [(i,) for i in int_ids])
+            self.conn.commit()
+            self._dirty = True
+
+    def _rows(self, int_ids: List[int]) -> Dict[int, tuple]:
+        rows = {}
+        for start in range(0, len(int_ids), _SQLITE_MAX_PARAMS):
+            batch = int_ids[start:start + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            for int_id, cid, doc, meta in self.conn.execute(
+                    f"SELECT int_id, id, document, metadata FROM chunks WHERE deleted = 0 AND int_id IN ({placeholders})",
+                    batch):
+                rows[int_id] = (cid, doc, json.loads(meta) if meta else {})
+        return rows
+
+    def _vectors_for(self, int_ids: np.ndarray) -> np.ndarray:
+        # exact vectors when a quantized index keeps them on the side
+        if self._vectors is not None and len(int_ids) and int_ids.max() < len(self._vectors):
+            return self._vectors.read(int_ids)
+        return self.index.reconstruct_batch(int_ids)
+
+    def _reconstruct(self, int_ids: List[int]) -> List[List[float]]:
+        if not int_ids:
+            return []
+        return self._vectors_for(np.asarray(int_ids, dtype=np.int64)).tolist()
+
+    def _search(self, vectors: np.ndarray, k: int, total: int):
+        """Search the index; with quantization, rescore `rescore * k` candidates at full precision."""
+        if self._vectors is None or self.rescore <= 1 or self._staged:
+            return self.index.search(vectors, min(k, total))
+        scores, labels = self.index.search(vectors, min(k * self.rescore, total))
+        if labels.max(initial=-1) >= len(self._vectors):
+            # vectors added before the sidecar existed cannot be rescored
+            return scores[:, :k], labels[:, :k]
+        for row, (query, candidates) in enumerate(zip(vectors, labels)):
+            valid = candidates[candidates >= 0]
+            full = self._vectors.read(valid)
+            if self.metric == "l2":
+                exact = ((full - query) ** 2).sum(axis=1)
+                order = np.argsort(exact, kind="stable")
+            else:
+                exact = full @ query
+                order = np.argsort(-exact, kind="stable")
+            scores[row, :len(valid)] = exact[order]
+            labels[row, :len(valid)] = valid[order]
+        return scores[:, :k], labels[:, :k]
+
+    def _to_distance(self, score: float) -> float:
+        if self.metric == "cosine":
+            return 1.0 - score
+        if self.metric == "ip":
+            return -score
+        return score
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict:
+        vectors = self._prepare(query_embeddings)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        with self._lock:
+            total = self.index.ntotal if self.index is not None else 0
+            if total == 0:
+                for key in result:
+                    result[key] = [[] for _ in range(len(vectors))]
+                return self._select(result, include)
+            tombstones = self.conn.execute("SELECT COUNT(*) FROM chunks WHERE deleted = 1").fetchone()[0]
+            k = n_results + tombstones
+            while True:
+                scores, labels = self._search(vectors, k, total)
+                rows = self._rows(sorted({int(i) for i in labels.ravel() if i >= 0}))
+                hits = [
+                    [(int(i), float(s)) for s, i in zip(srow, lrow)
+                     if i >= 0 and int(i) in rows and matches_where(rows[int(i)][2], where)][:n_results]
+                    for srow, lrow in zip(scores, labels)
+                ]
+                # a filter can reject most candidates; widen the search until satisfied
+                if not where or k >= total or all(len(h) == n_results for h in hits):
+                    break
+                k *= 4
+            if "embeddings" in include:
+                result["embeddings"] = [self._reconstruct([i for i, _ in h]) for h in hits]
+        for query_hits in hits:
+            result["ids"].append([rows[i][0] for i, _ in query_hits])
+            result["documents"].append([rows[i][1] for i, _ in query_hits])
+            result["metadatas"].append([rows[i][2] for i, _ in query_hits])
+            result["distances"].append([self._to_distance(s) for _, s in query_hits])
+        return self._select(result, include)
+
+    @staticmethod
+    def _select(result: Dict, include: Sequence[str]) -> Dict:
+        return {key: value for key, value in result.items() if key == "ids" or key in include}
+
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("documents", "metadatas")) -> Dict:
+        with self._lock:
+            if ids is None:
+                rows = self.conn.execute(
+                    "SELECT int_id, id, document, metadata FROM chunks WHERE deleted = 0 ORDER BY int_id").fetchall()
+            else:
+                rows = []
+                for start in range(0, len(ids), _SQLITE_MAX_PARAMS):
+                    batch = list(ids[start:start + _SQLITE_MAX_PARAMS])
+                    placeholders = ",".join("?" * len(batch))
+                    rows.extend(self.conn.execute(
+                        f"SELECT int_id, id, document, metadata FROM chunks WHERE deleted = 0 AND id IN ({placeholders})",
+                        batch))
+            result = {
+                "ids": [r[1] for r in rows],
+                "documents": [r[2] for r in rows],
+                "metadatas": [json.loads(r[3]) if r[3] else {} for r in rows],
+            }
+            if "embeddings" in include:
+                result["embeddings"] = self._reconstruct([int(r[0]) for r in rows])
+        return self._select(result, include)
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM chunks WHERE deleted = 0").fetchone()[0]